@@ -0,0 +1,116 @@
+from collections import OrderedDict
+import numpy as np
+import pyxel
+
+COLKEY = 229          # 透明色（車のスプライトと同じ）
+SPRITE_H = 24         # 車の画像の高さ
+SLOT_W = 50           # 一番幅の広いコマの幅
+CAR_FRAMES = ((0, 49), (26, 50), (26, -50))  # ステアリングのコマ (v, w): 直進, 右, 左（右の反転）
+SCALE_STEP = 1 / 16   # 拡大率はこの刻みに丸める
+PAGE_SIZE = 256
+
+
+class SpriteAtlas:
+    """車の画像を (ボディの色, 昼/夜, ステアリングのコマ, 拡大率の段階) ごとに塗り替え・縮小して
+    専用の Image（ページ）に焼いておき、ライバルの描画を等倍の blt 1回にする。
+    色は palette の「昼/夜 × 車の色」のプロファイルで置き換えて焼くので、pal() を戻した状態で
+    描けば pal(profile) を設定して元の画像を描いたときと同じ色になる。
+    起動時に入るだけ焼いておき、入りきらない分は使うときに焼いて、ページが埋まっていれば
+    同じ拡大率で一番長く使っていない絵の場所を使い回す（LRU）"""
+    def __init__(self, source, palette, pages=24):
+        self.palette = palette
+        self.source = np.ctypeslib.as_array(source.data_ptr(), shape=(source.height, source.width))
+        self.images = [pyxel.Image(PAGE_SIZE, PAGE_SIZE) for _ in range(pages)]
+        self.pages = [np.ctypeslib.as_array(image.data_ptr(), shape=(PAGE_SIZE, PAGE_SIZE))
+                      for image in self.images]
+        for page in self.pages:
+            page[:] = COLKEY
+        self.entries = OrderedDict()  # (色, 夜, v, w, 段階) -> (ページ, x, y, 幅, 高さ)。古い順
+        self.shelves = {}  # 段階 -> 焼き込み中の棚 [ページ, y, 次の x]
+        self.page_top = [0] * pages  # ページごとの棚を置いていない所の一番上
+        self.baked = 0  # 焼いた延べ回数
+
+    def prebake(self, colors, frames, min_scale, max_scale, nights=(False, True)):
+        # 遠く（小さい絵）から順に、ページが埋まるまで焼いておく
+        first, last = self.level(min_scale), self.level(max_scale)
+        for level in range(first, last + 1):
+            for night in nights:
+                for col in colors:
+                    for v, w in frames:
+                        if self.bake((col, night, v, w, level), evict=False) is None:
+                            return
+
+    @staticmethod
+    def level(scale):
+        return max(int(round(scale / SCALE_STEP)), 1)
+
+    def slot_size(self, level):
+        scale = level * SCALE_STEP
+        return max(int(SLOT_W * scale), 1), max(int(SPRITE_H * scale), 1)
+
+    def allocate(self, level):
+        sw, sh = self.slot_size(level)
+        shelf = self.shelves.get(level)
+        if shelf and shelf[2] + sw <= PAGE_SIZE:
+            x = shelf[2]
+            shelf[2] += sw
+            return shelf[0], x, shelf[1]
+        # 新しい棚を空いているページに置く
+        for page, top in enumerate(self.page_top):
+            if top + sh <= PAGE_SIZE and sw <= PAGE_SIZE:
+                self.page_top[page] = top + sh
+                self.shelves[level] = [page, top, sw]
+                return page, 0, top
+        return None
+
+    def bake(self, key, evict=True):
+        col, night, v, w, level = key
+        slot = self.allocate(level)
+        if slot is None:
+            if not evict:
+                return None
+            # 同じ大きさの絵のうち一番長く使っていないものと入れ替える
+            old = next((k for k in self.entries if k[4] == level), None)
+            if old is None:
+                return None
+            slot = self.entries.pop(old)[:3]
+        page, x, y = slot
+        scale = level * SCALE_STEP
+        region = self.source[v:v + SPRITE_H, 0:abs(w)]
+        if w < 0:
+            region = region[:, ::-1]
+        # 最近傍で縮小して、プロファイルどおりに色を置き換える（透明色はそのまま）
+        sw, sh = max(int(abs(w) * scale), 1), max(int(SPRITE_H * scale), 1)
+        rows = (np.arange(sh) / scale).astype(np.int64).clip(0, SPRITE_H - 1)
+        cols = (np.arange(sw) / scale).astype(np.int64).clip(0, abs(w) - 1)
+        region = region[rows][:, cols]
+        slot_w, slot_h = self.slot_size(level)
+        target = self.pages[page][y:y + slot_h, x:x + slot_w]
+        target[:] = COLKEY
+        target[:sh, :sw] = self.color_table(night, col)[region]
+        entry = (page, x, y, sw, sh)
+        self.entries[key] = entry
+        self.baked += 1
+        return entry
+
+    def color_table(self, night, col):
+        # 画素の値 -> 置き換え後の値 の表
+        table = np.arange(256, dtype=self.source.dtype)
+        for old, new in self.palette.profile(night, col).items():
+            table[old] = new
+        table[COLKEY] = COLKEY
+        return table
+
+    def draw(self, cx, cy, col, night, v, w, scale):
+        # (cx, cy) を中心に描く（pal() は戻しておく）。焼けなかった（ページがいっぱい）ときは False
+        key = (col, night, v, w, self.level(scale))
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.bake(key)
+            if entry is None:
+                return False
+        else:
+            self.entries.move_to_end(key)
+        page, x, y, sw, sh = entry
+        pyxel.blt(cx - sw / 2, cy - sh / 2, self.images[page], x, y, sw, sh, COLKEY)
+        return True
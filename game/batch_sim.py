@@ -0,0 +1,223 @@
+import copy
+import numpy as np
+from simulation import (Simulation, FPS, INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT,
+                        INPUT_GEAR_UP, INPUT_GEAR_DOWN, INPUT_NITRO)
+from track import SEGMENT_LENGTH
+
+
+def gear_table(gear_settings):
+    # GEAR_SETTINGS 形式（dict のリスト）を (ギア数, 2) の配列 [accel, max_vel] に変換
+    if isinstance(gear_settings, np.ndarray):
+        return gear_settings.astype(float)
+    return np.array([[g["accel"], g["max_vel"]] for g in gear_settings], dtype=float)
+
+
+class BatchSimulation:
+    """N 本のレースを NumPy 配列で同時に進める（Simulation.update_player と同じルール）。
+    ライバル車・木や看板との衝突は扱わない。
+    Simulation と同じコースで走らせるには track.track_curves(seed, ...) を track_data に渡す"""
+
+    def __init__(self, n, goal_distance=5.0, is_automatic=False, gear_settings=None,
+                 track_data=None, seed=None, shift_points=None):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        # ギア設定：全レース共通の (G, 2) か、レースごとの (N, G, 2)
+        table = gear_table(Simulation.GEAR_SETTINGS if gear_settings is None else gear_settings)
+        table = np.broadcast_to(table, (n,) + table.shape[-2:])
+        self.accel = table[:, :, 0].copy()
+        self.max_vel = table[:, :, 1].copy()
+        self.top_gear = table.shape[1] - 1
+        self.goal_distance = np.broadcast_to(np.asarray(goal_distance, dtype=float), (n,)).copy()
+        self.is_automatic = np.broadcast_to(np.asarray(is_automatic, dtype=bool), (n,)).copy()
+        # オートマの変速点：全レース共通の (2,) か、レースごとの (N, 2)
+        shift = np.asarray(Simulation.SHIFT_POINTS if shift_points is None else shift_points, dtype=float)
+        shift = np.broadcast_to(shift, (n, 2))
+        self.shift_up_rpm = shift[:, 0].copy()
+        self.shift_down_rpm = shift[:, 1].copy()
+        # コース：指定がなければレースごとにランダム生成（ゴールまで繰り返さない長さ）
+        if track_data is None:
+            segments = int(self.goal_distance.max() * 1000 / SEGMENT_LENGTH) + 2
+            self.track_data = self.rng.uniform(-1.5, 1.5, (n, segments))
+        else:
+            track_data = np.asarray(track_data, dtype=float)
+            self.track_data = np.broadcast_to(track_data, (n, track_data.shape[-1])).copy()
+        self.rows = np.arange(n)
+
+        zeros = np.zeros(n)
+        self.prev_inputs = np.zeros(n, dtype=np.int64)
+        self.gear = np.zeros(n, dtype=np.int64)
+        self.display_rpm = zeros.copy()
+        self.velocity = zeros.copy()
+        self.speed = zeros.copy()
+        self.car_x = zeros.copy()
+        self.kilometer = np.zeros(n, dtype=np.int64)
+        self.total_distance = zeros.copy()
+        self.odometer = zeros.copy()
+        self.track_pos = zeros.copy()
+        self.curve_val = zeros.copy()
+        self.target_curve = zeros.copy()
+        self.frame_count = np.zeros(n, dtype=np.int64)
+        self.goal_time = np.full(n, np.nan)
+        self.start_timer = np.full(n, 200, dtype=np.int64)
+        self.boost_timer = np.zeros(n, dtype=np.int64)
+        self.boost_cooldown = np.zeros(n, dtype=np.int64)
+        self.stall_timer = np.zeros(n, dtype=np.int64)
+        self.rocket_text_timer = np.zeros(n, dtype=np.int64)
+        self.respawn_timer = np.zeros(n, dtype=np.int64)
+        falses = np.zeros(n, dtype=bool)
+        self.is_goal = falses.copy()
+        self.is_braking = falses.copy()
+        self.is_boosting = falses.copy()
+        self.is_stalled = falses.copy()
+        self.is_rocket_start = falses.copy()
+        self.is_respawning = falses.copy()
+        self.is_out = falses.copy()
+
+    @property
+    def rpm(self):
+        return self.display_rpm
+
+    def take(self, index):
+        """index 番目のレースだけを並べた新しい BatchSimulation（同じレースを何度選んでもよい）"""
+        batch = copy.copy(self)
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray) and value.shape[:1] == (self.n,):
+                setattr(batch, name, value[index])
+        batch.n = len(index)
+        batch.rows = np.arange(batch.n)
+        return batch
+
+    def step(self, inputs):
+        """inputs はレースごとの入力ビットマスク（スカラーなら全レース共通）"""
+        inputs = np.broadcast_to(np.asarray(inputs, dtype=np.int64), (self.n,))
+        pressed = inputs & ~self.prev_inputs
+        self.prev_inputs = inputs.copy()
+        up = (inputs & INPUT_UP) != 0
+        down = (inputs & INPUT_DOWN) != 0
+        left = (inputs & INPUT_LEFT) != 0
+        right = (inputs & INPUT_RIGHT) != 0
+
+        # --- RPM（カウントダウン中は空ぶかし） ---
+        counting = self.start_timer > 0
+        rev = 0.9 + self.rng.uniform(-0.05, 0.05, self.n)
+        running_rpm = self.velocity / self.max_vel[self.rows, self.gear]
+        target_rpm = np.where(counting, np.where(up, rev, 0.0), running_rpm)
+        self.display_rpm = np.where(counting, self.display_rpm,
+                                    self.display_rpm + (target_rpm - self.display_rpm) * 0.1)
+        self.display_rpm += (target_rpm - self.display_rpm) * 0.2
+
+        # オートマチック
+        auto = self.is_automatic & ~counting & ~self.is_goal
+        shift_up = auto & (self.display_rpm > self.shift_up_rpm) & (self.gear < self.top_gear)
+        shift_down = auto & ~shift_up & (self.display_rpm < self.shift_down_rpm) & (self.gear > 0)
+        self.gear += shift_up
+        self.gear -= shift_down
+
+        # --- スタートのカウントダウン ---
+        self.start_timer -= counting
+        self.velocity[counting] = 0
+        st = self.start_timer
+        stall_on = counting & (st > 40) & up
+        self.is_stalled = (self.is_stalled | stall_on) & ~(counting & ~stall_on & ~up)
+        rocket_window = (10 < st) & (st < 40) & up
+        self.is_rocket_start |= counting & rocket_window & ~self.is_stalled
+        self.is_rocket_start &= ~(counting & ~rocket_window & (st < 10) & ~up)
+        started = counting & (st == 0)
+        self.frame_count[started] = 0
+        stall_start = started & self.is_stalled
+        self.stall_timer[stall_start] = 60
+        rocket = started & ~self.is_stalled & self.is_rocket_start
+        self.velocity[rocket] = 0.25
+        self.rocket_text_timer[rocket] = 60
+        self.frame_count[~counting] += 1
+
+        # --- コースアウトからの復帰中はこのフレームの操作をスキップ ---
+        respawning = self.is_respawning.copy()
+        self.respawn_timer[respawning] += 1
+        recovered = respawning & (self.respawn_timer > 30)
+        self.is_respawning[recovered] = False
+        self.car_x[recovered] = 0
+        active = ~respawning
+
+        # --- アクセル・ブレーキ・ニトロ ---
+        driving = active & ~self.is_goal & (self.start_timer == 0)
+        self.velocity[driving & self.is_stalled] = 0
+        ctl = driving & ~self.is_stalled
+        self.gear[ctl & ((pressed & INPUT_GEAR_UP) != 0)] += 1
+        self.gear[ctl & ((pressed & INPUT_GEAR_DOWN) != 0)] -= 1
+        np.clip(self.gear, 0, self.top_gear, out=self.gear)
+        accel = self.accel[self.rows, self.gear] * np.where(self.is_automatic, 0.8, 1.0)
+        max_vel = self.max_vel[self.rows, self.gear]
+        v = self.velocity
+        v_up = np.where(v < max_vel, v + 0.002 * accel, np.maximum(v - 0.001, max_vel))
+        v_down = np.maximum(v - 0.004, 0)
+        v_coast = np.maximum(v - 0.0005, 0)
+        v = np.where(ctl, np.where(up, v_up, np.where(down, v_down, v_coast)), v)
+        self.is_braking = np.where(ctl, ~up & down, self.is_braking)
+
+        boost_on = ctl & ((pressed & INPUT_NITRO) != 0) & (self.boost_cooldown == 0)
+        self.is_boosting |= boost_on
+        self.boost_timer[boost_on] = 30
+        self.boost_cooldown[boost_on] = 300
+        boosting = ctl & self.is_boosting
+        v = np.where(boosting, np.minimum(v + 0.005, 0.8), v)
+        self.boost_timer -= boosting
+        self.is_boosting &= ~(boosting & (self.boost_timer <= 0))
+        self.boost_cooldown -= ctl & (self.boost_cooldown > 0)
+
+        # ゴール後・スタート前：惰性で流す
+        coasting = active & ~driving
+        self.is_braking &= ~coasting
+        v = np.where(coasting & (self.start_timer == 0), np.maximum(v - (v - 0.05) / 100, 0.05), v)
+        centering = coasting & (np.abs(self.car_x) > 0.1)
+        self.car_x = np.where(centering, self.car_x - self.car_x * 0.03,
+                              np.where(coasting, 0.0, self.car_x))
+
+        # --- 位置・コースの更新 ---
+        v = np.where(active, v, self.velocity)
+        self.velocity = v
+        self.speed += np.where(active, v, 0)
+        self.kilometer = np.where(active, (v * 400).astype(np.int64), self.kilometer)
+        counting_dist = active & ~self.is_goal
+        self.total_distance += np.where(counting_dist, v * 0.005, 0)
+        self.odometer = np.where(counting_dist, np.round(self.total_distance, 2), self.odometer)
+
+        self.track_pos += np.where(active, v * 5, 0)
+        idx = (self.track_pos / SEGMENT_LENGTH).astype(np.int64) % self.track_data.shape[1]
+        self.target_curve = np.where(active, self.track_data[self.rows, idx], self.target_curve)
+        self.curve_val += np.where(active, (self.target_curve - self.curve_val) * 0.05, 0)
+
+        steering = active & ~self.is_goal
+        move_amount = 7.5 * np.sin(np.clip(v / 0.6 * np.pi, 0, np.pi))
+        steer = np.where(left, -move_amount, np.where(right, move_amount, 0.0))
+        self.car_x += np.where(steering, steer - self.curve_val * (v * 7), 0)
+
+        # コースアウト（芝生）で減速、大きく外れたらリスポーン
+        out = steering & (np.abs(self.car_x) > Simulation.ROAD_LIMIT)
+        self.is_out = np.where(active, out, self.is_out)
+        slow = out & (self.velocity > 0.15)
+        self.velocity[slow] = np.maximum(self.velocity[slow] - 0.005, 0)
+        lost = out & (np.abs(self.car_x) > 400)
+        self.is_respawning |= lost
+        self.velocity[lost] = 0
+        self.respawn_timer[lost] = 0
+
+        goal = active & ~self.is_goal & (self.odometer >= self.goal_distance)
+        self.is_goal |= goal
+        self.goal_time[goal] = self.frame_count[goal] / FPS
+
+        # 表示用タイマー
+        text_done = (self.rocket_text_timer == 1)
+        self.rocket_text_timer -= self.rocket_text_timer > 0
+        self.is_rocket_start &= ~text_done
+        stall_done = (self.stall_timer == 1)
+        self.stall_timer -= self.stall_timer > 0
+        self.is_stalled &= ~stall_done
+
+    def run(self, driver, max_ticks=100000):
+        """driver(batch) が返す入力で全レースがゴールするまで進め、ゴールタイムを返す（未完走は nan）"""
+        for _ in range(max_ticks):
+            if self.is_goal.all():
+                break
+            self.step(driver(self) if callable(driver) else driver)
+        return self.goal_time
@@ -0,0 +1,208 @@
+"""ウィンドウを開かずに App の update/draw を回して、決まったシナリオで
+fps・1フレームあたりの描画コール数・メモリ確保量を測る。
+
+    python bench.py                          # 全シナリオを実行
+    python bench.py --save bench_baseline.json
+    python bench.py --compare bench_baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fake_pyxel
+sys.modules["pyxel"] = fake_pyxel  # main.py より先に差し替える
+
+from main import App  # noqa: E402
+from simulation import (FPS, INPUT_UP, INPUT_LEFT, INPUT_RIGHT,  # noqa: E402
+                        INPUT_GEAR_UP, INPUT_NITRO)
+
+SEED = 12345
+BASELINE_FILE = "bench_baseline.json"
+APP_OPTIONS = {}  # シナリオ開始前に App に設定する属性
+
+
+def full_throttle(app, frame):
+    # アクセル全開、回転が上がったらシフトアップ、コース中央を保つ
+    sim = app.sim
+    inputs = INPUT_UP
+    if sim.rpm > 0.9 and frame % 2 == 0:
+        inputs |= INPUT_GEAR_UP
+    if sim.car_x > 20:
+        inputs |= INPUT_LEFT
+    elif sim.car_x < -20:
+        inputs |= INPUT_RIGHT
+    return inputs
+
+
+def nitro_spam(app, frame):
+    inputs = full_throttle(app, frame)
+    if frame % 2 == 0:
+        inputs |= INPUT_NITRO
+    return inputs
+
+
+def rivals_ahead(app, frame):
+    # ライバルが3台そろうように、自車の真正面に遅い車を置き続ける
+    sim = app.sim
+    traffic = sim.traffic
+    if sim.start_timer == 0 and frame % 15 == 0:
+        n = len(traffic)
+        ahead = (traffic.blown_timer[:n] == 0) & (traffic.depth[:n] > 0)
+        count = int(ahead.sum())
+        if count < 3:
+            i = sim.spawn_rival(250 + 80 * count)
+            if i >= 0:
+                traffic.set_car(i, sim.car_x, 40)
+    return full_throttle(app, frame)
+
+
+# 名前, ゴール距離, 夜, 入力を決める関数, App に設定する属性
+SCENARIOS = [
+    ("top_speed_10km", 10.0, False, full_throttle, {}),
+    ("nitro_spam", 3.0, False, nitro_spam, {}),
+    ("night", 3.0, True, full_throttle, {}),
+    ("rival_collisions", 2.0, False, rivals_ahead, {"rival_limit": 6}),
+    ("dense_traffic", 5.0, False, full_throttle,
+     {"rival_limit": 400, "rival_interval": 1, "rival_lanes": 4}),
+]
+
+
+def make_app(goal_distance, night, options=None):
+    app = App(seed=SEED)
+    app.frame_dt = 1 / FPS  # 1フレーム = シミュレーション1ステップ（実時間は測らない）
+    app.goal_distance = goal_distance
+    app.is_night_mode = night
+    for name, value in dict(options or {}, **APP_OPTIONS).items():
+        setattr(app, name, value)
+    app.state = app.STATE_PLAY
+    app.reset()
+    return app
+
+
+def run_scenario(goal_distance, night, driver, max_frames, trace_alloc, options=None):
+    app = make_app(goal_distance, night, options)
+    keys = App.INPUT_KEYS
+    fake_pyxel.reset_counters()
+    times, allocs = [], []
+    frame = after_goal = 0
+    while frame < max_frames and after_goal < 30:
+        inputs = driver(app, frame)
+        fake_pyxel.set_held_keys([key for key, bit in keys if inputs & bit])
+        if trace_alloc:
+            # そのフレームの中で一時的に確保された量（ピーク − 開始時）
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        app.update()
+        app.draw()
+        times.append(time.perf_counter() - start)
+        if trace_alloc:
+            allocs.append(tracemalloc.get_traced_memory()[1] - base)
+        fake_pyxel.end_frame()
+        frame += 1
+        if app.sim.is_goal:
+            after_goal += 1
+    return app, times, allocs
+
+
+def bench(name, goal_distance, night, driver, options, max_frames):
+    app, times, _ = run_scenario(goal_distance, night, driver, max_frames, False, options)
+    frames = len(times)
+    calls = fake_pyxel.calls
+    draw_calls = fake_pyxel.draw_calls()
+    # メモリ計測は遅くなるので時間計測とは別に回す
+    tracemalloc.start()
+    _, _, allocs = run_scenario(goal_distance, night, driver, max_frames, True, options)
+    tracemalloc.stop()
+    times.sort()
+    return {
+        "frames": frames,
+        "goal_time": app.sim.goal_time if app.sim.is_goal else None,
+        "rivals_spawned": app.sim.traffic.spawned,
+        "fps": frames / sum(times),
+        "frame_ms_p50": times[frames // 2] * 1000,
+        "frame_ms_p99": times[min(int(frames * 0.99), frames - 1)] * 1000,
+        "draw_calls_per_frame": draw_calls / frames,
+        "pal_per_frame": calls["pal"] / frames,
+        "alloc_kb_per_frame": sum(allocs) / len(allocs) / 1024,
+    }
+
+
+COLUMNS = [("fps", "fps", "{:9.1f}"), ("frame_ms_p99", "p99 ms", "{:9.2f}"),
+           ("draw_calls_per_frame", "draws/f", "{:9.1f}"), ("pal_per_frame", "pal/f", "{:9.1f}"),
+           ("alloc_kb_per_frame", "alloc KB/f", "{:11.1f}")]
+
+
+def report(results, baseline):
+    print(f"{'scenario':18}{'frames':>7}" + "".join(f"{title:>{len(fmt.format(0))}}" for _, title, fmt in COLUMNS))
+    for name, result in results.items():
+        line = f"{name:18}{result['frames']:7d}" + "".join(fmt.format(result[key]) for key, _, fmt in COLUMNS)
+        print(line)
+        if name in baseline:
+            # 基準値との差（%）
+            diffs = []
+            for key, _, fmt in COLUMNS:
+                old = baseline[name].get(key)
+                if old:
+                    diffs.append(f"{(result[key] - old) / old * 100:+{len(fmt.format(0)) - 1}.1f}%")
+                else:
+                    diffs.append(" " * len(fmt.format(0)))
+            print(f"{'  vs baseline':25}" + "".join(diffs))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Headless benchmark of App.update/App.draw.")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run (default: all)")
+    parser.add_argument("--max-frames", type=int, default=20000, help="frame limit per scenario")
+    parser.add_argument("--rasterize", action="store_true", help="draw into a NumPy framebuffer")
+    parser.add_argument("--rect-road", action="store_true", help="draw the road with per-scanline rects")
+    parser.add_argument("--scaled-rivals", action="store_true", help="draw rivals with scaled blt instead of the atlas")
+    parser.add_argument("--compare", metavar="JSON", help="compare against a stored baseline")
+    parser.add_argument("--save", metavar="JSON", help="store the results as a baseline")
+    args = parser.parse_args(argv)
+
+    names = [s[0] for s in SCENARIOS]
+    for name in args.scenarios:
+        if name not in names:
+            parser.error(f"unknown scenario {name!r} (choose from {', '.join(names)})")
+    fake_pyxel.rasterize = args.rasterize
+    if args.rect_road:
+        APP_OPTIONS["use_road_raster"] = False
+    if args.scaled_rivals:
+        APP_OPTIONS["use_car_atlas"] = False
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    compare = args.compare and os.path.abspath(args.compare)
+    save = args.save and os.path.abspath(args.save)
+
+    # 記録やリプレイが書き出されるので、一時ディレクトリの中で走らせる
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        os.chdir(work)
+        try:
+            for name, goal_distance, night, driver, options in SCENARIOS:
+                if not args.scenarios or name in args.scenarios:
+                    results[name] = bench(name, goal_distance, night, driver, options, args.max_frames)
+        finally:
+            os.chdir(cwd)
+
+    report(results, baseline)
+    if save:
+        if save == compare:
+            baseline.update(results)
+            results = baseline
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
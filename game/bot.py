@@ -0,0 +1,342 @@
+"""seed（またはコースファイル）のコースを最速で走る入力列をビームサーチで探すボット。
+
+STEP_TICKS フレームごとに、残っている候補それぞれに全部の操作（アクセル/ブレーキ・
+ハンドル・シフト・ニトロ）を試し、BatchSimulation でまとめて進める。
+(速度, ギア, 横位置, ニトロの待ち時間, …) を丸めた状態が同じ候補は一番先に進んだものだけを
+残し（メモ化）、見込みの良い上位 beam 個で次に進む。道路の端に寄りすぎる候補は捨てるので木や看板には
+当たらない。ハンドルは速いほど効かなくなるので、コースのカーブ表から「この先のカーブを曲がりきれる速度」の
+上限を後ろから求めておき、候補ごとにその上限まで減速しながら SAFETY_TICKS フレーム先まで走らせてみて、
+道路にとどまれないものは後回しにする。それでも候補がなくなったら、何区間か前に戻ってブレーキを踏み直す。
+ライバル車は扱わないので、ライバルなしで走ったタイムになる（記録の目安・負荷テスト用）。
+
+    python bot.py SEED GOAL_KM                  # 計画したタイムと、Simulation で確かめたタイム
+    python bot.py SEED GOAL_KM --out bot.hrr    # リプレイとして保存（replay.py やゲームで再生できる）
+    python bot.py --course course.hrtk          # コースファイルのコースで
+    python bot.py --check records.log           # 記録のうち、ボットより速すぎるものを探す
+    python bot.py --regress                     # 決まった seed・距離で必ずゴールできるかを確かめる
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from batch_sim import BatchSimulation
+from course import Course
+from records import RecordStore, atomic_write
+from replay import Recorder
+from simulation import (Simulation, FPS, INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT,
+                        INPUT_GEAR_UP, INPUT_GEAR_DOWN, INPUT_NITRO)
+from track import SEGMENT_LENGTH, track_curves
+
+STEP_TICKS = 10  # 操作を決め直す間隔（フレーム）
+BEAM = 48        # 残す候補の数
+LOOKAHEAD = 30   # 今の速度をあと何フレーム分の距離とみなすか（候補の見込み）
+EDGE_X = 150     # 横位置をこの内側に保つ（道路の端 ROAD_LIMIT より手前で、縁石脇の看板に当たらない）
+SAFETY_TICKS = 60  # この先このフレーム数、速度の上限まで減速すれば道路にとどまれる候補を優先して残す
+SAFETY_CHUNKS = 4  # 道路にとどまれるかを調べる候補は多くとも beam のこの倍数まで
+MAX_BACKTRACKS = 64  # 候補がなくなって前に戻るのはこの回数まで
+BUTTONS = INPUT_GEAR_UP | INPUT_GEAR_DOWN | INPUT_NITRO  # 押した瞬間だけ効くボタン
+CACHE_FILE = "bot_times.json"  # --check で計算したボットのタイム
+# 決まった seed・距離（--regress）。以前に候補がなくなってゴールできなかったものを含む
+REGRESSION_RUNS = [(seed, 10.0, False) for seed in (1, 2, 3, 5, 7, 11, 999, 12345)] + [
+    (12345, 1.0, False), (12345, 1.0, True), (2, 10.0, True), (999, 5.0, True), (42, 3.0, False)]
+
+
+def make_actions(is_automatic):
+    # 試す操作の一覧。ボタンは区間の最初のフレームだけ押す
+    actions = []
+    for pedal in (INPUT_UP, 0, INPUT_DOWN):
+        for steer in (0, INPUT_LEFT, INPUT_RIGHT):
+            for gear in ((0,) if is_automatic else (0, INPUT_GEAR_UP, INPUT_GEAR_DOWN)):
+                for nitro in (0, INPUT_NITRO):
+                    actions.append(pedal | steer | gear | nitro)
+    return np.array(actions, dtype=np.int64)
+
+
+def steer_amount(v):
+    # 1フレームにハンドルで動ける横幅（Simulation と同じ式。速すぎるとハンドルが効かない）
+    return 7.5 * np.sin(np.clip(v / 0.6 * np.pi, 0, np.pi))
+
+
+def speed_limits(curves):
+    """セグメントごとの速度の上限 (そのセグメントの中, そのセグメントに入るとき) を返す。
+    中での上限は、カーブに流される幅（curve * v * 7）をハンドルで打ち消せる速度。
+    入るときの上限は、後ろのセグメントから順にブレーキで落とせる分を足していく"""
+    v = np.linspace(0, 0.8, 161)
+    c = np.abs(np.asarray(curves, dtype=float))
+    # curve_val は前のセグメントの値から少しずつ移るので、前のセグメントのカーブも見る
+    c = np.maximum(c, np.concatenate([c[:1], c[:-1]]))
+    ok = steer_amount(v)[None, :] >= c[:, None] * (v[None, :] * 7)
+    first_bad = np.where(ok.all(axis=1), len(v), np.argmin(ok, axis=1))
+    inside = v[first_bad - 1]
+    entry = inside.copy()
+    for i in range(len(entry) - 2, -1, -1):
+        # 1セグメント（track_pos 150 = 30 / v フレーム）で落とせる速度は 0.004 * 30 / v
+        entry[i] = min(inside[i], entry[i + 1] + 0.1 / max(entry[i + 1], 0.1))
+    return inside, entry
+
+
+def allowed_speed(batch, limits):
+    # 今いる位置での速度の上限（次のセグメントに入るまでにブレーキで間に合う速さ）
+    inside, entry = limits
+    pos = batch.track_pos / SEGMENT_LENGTH
+    seg = np.minimum(pos.astype(np.int64), len(inside) - 1)
+    nxt = np.minimum(seg + 1, len(inside) - 1)
+    margin = 0.1 / np.maximum(entry[nxt], 0.1) * (1 - (pos - seg)).clip(0, 1)
+    return np.minimum(inside[seg], entry[nxt] + margin)
+
+
+def state_keys(batch):
+    # 丸めた状態を1つの整数にまとめる（同じ値なら同じ状態とみなす）
+    key = np.round(batch.velocity / 0.004).astype(np.int64)
+    for value, size in ((batch.gear, 8),
+                        (np.round(batch.car_x / 8).astype(np.int64) + 64, 128),
+                        (batch.boost_cooldown // 30, 16),
+                        (batch.is_boosting, 2), (batch.is_stalled, 2),
+                        (batch.is_rocket_start, 2), (batch.is_respawning, 2)):
+        key = key * size + value
+    return key
+
+
+def useful_actions(batch, actions, braking=False):
+    # (候補, 操作) ごとに試す意味があるか。効かないニトロやシフトは押さなかったのと同じなので除く。
+    # braking のときはアクセルとニトロを使わない（前に戻ってやり直すとき）
+    started = (batch.start_timer == 0)[:, None]
+    nitro = (actions & INPUT_NITRO) != 0
+    up = (actions & INPUT_GEAR_UP) != 0
+    down = (actions & INPUT_GEAR_DOWN) != 0
+    useful = ~nitro | (started & (batch.boost_cooldown == 0)[:, None])
+    useful &= ~up | (started & (batch.gear < batch.top_gear)[:, None])
+    useful &= ~down | (started & (batch.gear > 0)[:, None])
+    if braking:
+        useful &= ~started | ((actions & (INPUT_UP | INPUT_NITRO)) == 0)
+    return useful
+
+
+def recover_inputs(batch, limits):
+    # 速度の上限まで減速しながら、カーブに流される向きと逆にハンドルを切る（道路にとどまれるかの確認用）
+    v = batch.velocity
+    drift = batch.curve_val * (v * 7)
+    too_fast = (v > allowed_speed(batch, limits)) | (np.abs(drift) > steer_amount(v) * 0.7)
+    inputs = np.where(too_fast, INPUT_DOWN, INPUT_UP)
+    ahead = batch.car_x - drift
+    inputs[ahead > 5] |= INPUT_LEFT
+    inputs[ahead < -5] |= INPUT_RIGHT
+    return inputs
+
+
+def stays_on_road(batch, limits, ticks=SAFETY_TICKS):
+    # 各候補が recover_inputs で ticks フレームの間 EDGE_X の内側にいて、最後に上限まで減速できているか
+    batch = batch.take(np.arange(batch.n))
+    went_out = np.zeros(batch.n, dtype=bool)
+    for _ in range(ticks):
+        batch.step(recover_inputs(batch, limits))
+        went_out |= np.abs(batch.car_x) > EDGE_X
+    return ~went_out & (batch.velocity <= allowed_speed(batch, limits) + 0.02)
+
+
+def plan(curves, goal_distance, is_automatic=False, beam=BEAM, seed=None):
+    """curves のコースを走る (ゴールタイム, 1フレームごとの入力の bytes) を返す。
+    ゴールできなければタイムは None"""
+    curves = np.asarray(curves, dtype=float)
+    limits = speed_limits(curves)
+    actions = make_actions(is_automatic)
+    first_inputs, held_inputs = actions, actions & ~BUTTONS
+    max_blocks = int((200 + goal_distance / (0.05 * 0.005)) / STEP_TICKS) + 1
+    # states[k]: 区間 k を始めるときの候補, history[k]: 区間 k の (親の候補番号, 操作の番号)
+    states = [BatchSimulation(1, goal_distance, is_automatic, track_data=curves, seed=seed)]
+    history = []
+    brake_until = 0  # この区間まではアクセルを踏まない（前に戻ってやり直し中）
+    backtracks = depth = failed_at = 0
+    k = 0
+    while k < max_blocks:
+        # 全候補 × 効き目のある操作を並べて STEP_TICKS フレーム進める
+        parent, action = np.nonzero(useful_actions(states[k], actions, braking=k < brake_until))
+        batch = states[k].take(parent)
+        batch.step(first_inputs[action])
+        went_out = np.abs(batch.car_x) > EDGE_X
+        for _ in range(STEP_TICKS - 1):
+            batch.step(held_inputs[action])
+            went_out |= np.abs(batch.car_x) > EDGE_X
+        if batch.is_goal.any():
+            best = int(np.nanargmin(batch.goal_time))
+            return float(batch.goal_time[best]), trace(history + [(parent, action)], best,
+                                                       first_inputs, held_inputs)
+        # EDGE_X より外に出た候補は捨てる（木や看板はその外にしかないので、Simulation でも同じ走りになる）
+        # 同じ状態なら一番先に進んだものだけ残し、見込みの良い順に、この先も道路にとどまれるものを beam 個
+        score = batch.total_distance + batch.velocity * 0.005 * LOOKAHEAD
+        order = np.argsort(-score, kind="stable")
+        order = order[~went_out[order]]
+        _, first = np.unique(state_keys(batch)[order], return_index=True)
+        order = order[np.sort(first)]
+        checked = order[:beam * SAFETY_CHUNKS]
+        safe = stays_on_road(batch.take(checked), limits)
+        keep = np.concatenate([checked[safe], checked[~safe], order[checked.size:]])[:beam]
+        if keep.size == 0:
+            # 全部道路から出た。同じ所でまた失敗するたびに倍の区間だけ前に戻り、そこからブレーキを踏み直す
+            backtracks += 1
+            if backtracks > MAX_BACKTRACKS or k == 0:
+                break
+            depth = depth * 2 if k <= failed_at else 1
+            failed_at = max(failed_at, k)
+            start = max(k - depth, 0)
+            del states[start + 1:], history[start:]
+            brake_until = k + 1
+            k = start
+            continue
+        states.append(batch.take(keep))
+        history.append((parent[keep], action[keep]))
+        k += 1
+    return None, b""
+
+
+def trace(history, index, first_inputs, held_inputs):
+    # 最後の候補から親をたどって、1フレームごとの入力列にする
+    blocks = []
+    for parent, action in reversed(history):
+        a = action[index]
+        blocks.append([first_inputs[a]] + [held_inputs[a]] * (STEP_TICKS - 1))
+        index = parent[index]
+    return bytes(int(v) for block in reversed(blocks) for v in block)
+
+
+def seed_curves(seed, goal_distance):
+    # seed のランダムなコースのゴールまでのカーブ（Simulation の TrackStream と同じ）
+    return track_curves(seed, int(goal_distance * 1000 / SEGMENT_LENGTH) + 2)
+
+
+def replay_plan(seed, goal_distance, is_automatic, inputs, course=None):
+    # 計画した入力を Simulation（ライバルなし）で再生して確かめ、リプレイとして記録する
+    sim = Simulation(goal_distance, is_automatic, seed=seed, rival_limit=0, course=course)
+    recorder = Recorder(sim)
+    for value in inputs:
+        recorder.record(value)
+        sim.step(value)
+        if sim.is_goal:
+            break
+    return sim, recorder
+
+
+class ReferenceTimes:
+    """(seed またはコース, 距離, AT/MT) ごとのボットのタイム。計画は重いので CACHE_FILE に残しておく。
+    ゴールできなかったものは None として残す"""
+    def __init__(self, cache_file=CACHE_FILE, beam=BEAM):
+        self.cache_file = cache_file
+        self.beam = beam
+        self.times = {}
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, "r") as f:
+                    self.times = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Load Error: {e}")
+
+    def get(self, seed, goal_distance, is_automatic, course=None):
+        name = f"course {course.course_id:08x}" if course else f"seed {seed}"
+        key = f"{name}|{float(goal_distance)}|{'AT' if is_automatic else 'MT'}|beam {self.beam}"
+        if key not in self.times:
+            curves = course.curves if course else seed_curves(seed, goal_distance)
+            self.times[key] = plan(curves, goal_distance, is_automatic, self.beam, seed)[0]
+            if self.cache_file:
+                try:
+                    atomic_write(self.cache_file, json.dumps(self.times, indent=1).encode())
+                except OSError as e:
+                    print(f"Save Error: {e}")
+        return self.times[key]
+
+
+def check_records(log_file, margin, courses=(), cache_file=CACHE_FILE):
+    """記録のうち、同じ条件のボットのタイムより margin 秒以上速いものを挙げる。
+    (速すぎる記録の数, 確かめられなかった記録の数) を返す"""
+    courses = {course.course_id: course for course in courses}
+    times = ReferenceTimes(cache_file)
+    suspicious = unchecked = 0
+    for record in RecordStore(log_file, index_file=None, legacy_file=None, read_only=True).history():
+        label = f"{record['distance']}km seed {record.get('seed')}: {record['time']:.2f}s"
+        course_id = record.get("course_id", 0)
+        if record.get("automatic") is None or record.get("seed") is None:
+            reason = "unknown conditions"
+        elif course_id and course_id not in courses:
+            reason = f"needs course {course_id:08x}"
+        else:
+            bound = times.get(record["seed"], record["distance"], record["automatic"], courses.get(course_id))
+            if bound is None:
+                reason = "the bot did not reach the goal"
+            else:
+                if record["time"] < bound - margin:
+                    suspicious += 1
+                    print(f"{label} is faster than the bot ({bound:.2f}s)")
+                continue
+        unchecked += 1
+        print(f"{label} UNCHECKED ({reason})")
+    return suspicious, unchecked
+
+
+def regress(beam=BEAM):
+    # REGRESSION_RUNS が全部ゴールでき、Simulation で再生しても同じタイムになるか
+    ok = True
+    for seed, goal_distance, is_automatic in REGRESSION_RUNS:
+        start = time.perf_counter()
+        goal_time, inputs = plan(seed_curves(seed, goal_distance), goal_distance, is_automatic, beam, seed)
+        elapsed = time.perf_counter() - start
+        label = f"seed {seed:6} {goal_distance:5}km {'AT' if is_automatic else 'MT'}"
+        if goal_time is None:
+            print(f"{label}  NO PLAN ({elapsed:.1f}s)")
+            ok = False
+            continue
+        sim, _ = replay_plan(seed, goal_distance, is_automatic, inputs)
+        valid = sim.is_goal and abs(sim.goal_time - goal_time) < 1 / FPS / 2
+        print(f"{label}  {goal_time:7.2f}s  {'OK' if valid else 'MISMATCH'} ({elapsed:.1f}s)")
+        ok = ok and valid
+    return ok
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Plan a near-optimal race with beam search.")
+    parser.add_argument("seed", type=int, nargs="?")
+    parser.add_argument("goal_distance", type=float, nargs="?", help="goal distance in km")
+    parser.add_argument("--course", action="append", default=[],
+                        help="course file to plan on (with --check: may be given several times)")
+    parser.add_argument("--automatic", action="store_true", help="plan for the automatic transmission")
+    parser.add_argument("--beam", type=int, default=BEAM, help="candidates kept per step")
+    parser.add_argument("--out", help="save the plan as a replay file")
+    parser.add_argument("--check", metavar="RECORDS_LOG", help="list records faster than the bot")
+    parser.add_argument("--margin", type=float, default=0.5, help="seconds of slack for --check")
+    parser.add_argument("--regress", action="store_true", help="plan a fixed set of races and check all finish")
+    args = parser.parse_args(argv)
+
+    courses = [Course.load(path) for path in args.course]
+    if args.regress:
+        return 0 if regress(args.beam) else 1
+    if args.check:
+        suspicious, unchecked = check_records(args.check, args.margin, courses)
+        print(f"{suspicious} suspicious, {unchecked} unchecked")
+        return 1 if suspicious or unchecked else 0
+    course = courses[0] if courses else None
+    if course:
+        seed, goal_distance = args.seed or 0, course.goal_distance
+        curves = course.curves
+    elif args.seed is None or args.goal_distance is None:
+        parser.error("SEED and GOAL_KM (or --course) are required")
+    else:
+        seed, goal_distance = args.seed, args.goal_distance
+        curves = seed_curves(seed, goal_distance)
+    start = time.perf_counter()
+    goal_time, inputs = plan(curves, goal_distance, args.automatic, args.beam, seed)
+    elapsed = time.perf_counter() - start
+    if goal_time is None:
+        print(f"no plan reached the goal ({elapsed:.1f}s)")
+        return 1
+    print(f"planned goal time: {goal_time:.2f}s ({len(inputs)} frames, planned in {elapsed:.1f}s)")
+    sim, recorder = replay_plan(seed, goal_distance, args.automatic, inputs, course)
+    result = f"{sim.goal_time:.2f}s" if sim.is_goal else "DID NOT FINISH"
+    print(f"Simulation replay: {result}  ({sim.tick / FPS:.0f}s of game time)")
+    if args.out:
+        recorder.save(args.out)
+        print(f"saved {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
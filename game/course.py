@@ -0,0 +1,172 @@
+"""決まったコース（カーブ・木や看板・ライバルの出現表・ゴール距離）を1つのバイナリファイルに
+まとめたもの。中身は np.memmap で開くので、長いコースでも読み込みは一瞬で、
+走った分だけ OS がページを読み込む。
+
+    python course.py make SEED GOAL_KM OUT.hrtk   # seed のランダムなコースを書き出す
+    python course.py info COURSE.hrtk
+"""
+import argparse
+import random
+import struct
+import sys
+import zlib
+import numpy as np
+from roadside import RoadsideStream, RoadObject
+from track import Segment, SEGMENT_LENGTH, track_curves
+from traffic import TrafficPool, SPAWN_DEPTH
+
+# ヘッダ: マジック, バージョン, コースID（本体の CRC32）, ゴール距離, カーブ数, 木・看板の数, ライバルの数
+HEADER = struct.Struct("<4sBIdIII")
+MAGIC = b"HRTK"
+VERSION = 1
+OBJECT_TYPES = ("tree", "sign")
+CURVE = np.dtype("<f8")  # セグメントごとのカーブ
+OBJECT = np.dtype([("depth", "<f8"), ("margin_x", "<f8"), ("size", "<f8"),
+                   ("type", "u1"), ("color", "u1")])  # 奥行き順
+SPAWN = np.dtype([("frame", "<u4"), ("depth", "<f8"), ("offset_x", "<f8"),
+                  ("speed_kmh", "<f8"), ("col", "u1")])  # スタートからのフレーム順
+DEPTH_PER_KM = 200  # 走行距離 1km あたりの奥行き（speed）
+
+
+def open_array(path, dtype, offset, count):
+    if count == 0:
+        return np.zeros(0, dtype=dtype)  # 長さ 0 は memmap できない
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+class Course:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size or header[:4] != MAGIC:
+            raise ValueError("not a course file")
+        magic, version, course_id, goal_distance, n_curves, n_objects, n_spawns = HEADER.unpack(header)
+        if version != VERSION:
+            raise ValueError(f"unsupported course version {version}")
+        self.path = path
+        self.course_id = course_id
+        self.goal_distance = goal_distance
+        offset = HEADER.size
+        self.curves = open_array(path, CURVE, offset, n_curves)
+        offset += CURVE.itemsize * n_curves
+        self.objects = open_array(path, OBJECT, offset, n_objects)
+        offset += OBJECT.itemsize * n_objects
+        self.spawns = open_array(path, SPAWN, offset, n_spawns)
+
+    @classmethod
+    def load(cls, path):
+        return cls(path)
+
+    @staticmethod
+    def save(path, goal_distance, curves, objects, spawns):
+        curves = np.asarray(curves, dtype=CURVE)
+        objects = np.sort(np.asarray(objects, dtype=OBJECT), order="depth", kind="stable")
+        spawns = np.sort(np.asarray(spawns, dtype=SPAWN), order="frame", kind="stable")
+        body = curves.tobytes() + objects.tobytes() + spawns.tobytes()
+        header = HEADER.pack(MAGIC, VERSION, zlib.crc32(body), goal_distance,
+                             len(curves), len(objects), len(spawns))
+        with open(path, "wb") as f:
+            f.write(header + body)
+
+    @staticmethod
+    def generate(seed, goal_distance, roadside_density=1 / 3, rival_interval=90):
+        """seed から作られるランダムなコースを、ゴールまで配列にして返す (curves, objects, spawns)"""
+        curves = track_curves(seed, int(goal_distance * 1000 / SEGMENT_LENGTH) + 2)
+        # 木・看板はレース中と同じ RoadsideStream を進めて、新しく出てきたものを順に記録する
+        stream = RoadsideStream(roadside_density, rng=random.Random(f"{seed}:roadside"))
+        objects, last = [], -1.0
+        end = goal_distance * DEPTH_PER_KM
+        speed = 0.0
+        while speed < end:
+            stream.advance(speed)
+            new = []
+            for k in range(len(stream) - 1, -1, -1):
+                obj = stream[k]
+                if obj.depth <= last:
+                    break
+                new.append((obj.depth, obj.margin_x, obj.size, OBJECT_TYPES.index(obj.type), obj.color))
+            if new:
+                last = new[0][0]
+                objects += reversed(new)
+            speed += 1.0
+        # ライバルはレース中と同じく (interval + 1) フレームごとに1台。
+        # ゆっくり走っても足りなくならないよう、最高速の半分でゴールするまでの分を作る
+        traffic = TrafficPool(1, rng=random.Random(f"{seed}:rival"))
+        frames = int(goal_distance / (0.35 * 0.005))
+        spawns = []
+        for frame in range(0, frames, rival_interval + 1):
+            traffic.clear()
+            traffic.spawn(SPAWN_DEPTH)
+            spawns.append((frame, SPAWN_DEPTH, traffic.offset_x[0], traffic.speed_kmh[0], traffic.col[0]))
+        return curves, objects, spawns
+
+
+class CourseTrack:
+    """Course のカーブ表を TrackStream と同じ形で読む（最後のセグメントから先はそのまま続く）"""
+    def __init__(self, curves):
+        self.curves = curves
+        self.index = -1
+        self.segment = Segment(0.0)
+
+    def segment_at(self, track_pos):
+        index = min(int(track_pos / SEGMENT_LENGTH), len(self.curves) - 1)
+        if index != self.index and index >= 0:
+            self.index = index
+            self.segment = Segment(float(self.curves[index]))
+        return self.segment
+
+
+class CourseRoadside(RoadsideStream):
+    """Course の木・看板を、見える範囲に入ったものから順に RoadsideStream に流し込む"""
+    def __init__(self, objects, view_ahead=12.0):
+        self.objects = objects
+        self.next_index = 0
+        super().__init__(view_ahead=view_ahead)
+
+    def advance(self, speed):
+        self.drop_passed(speed)
+        objects = self.objects
+        depths = objects["depth"]
+        if self.next_index < len(objects) and depths[self.next_index] < speed:
+            # 一気に進んだ場合は見える範囲まで飛ばす
+            self.next_index = int(np.searchsorted(depths, speed))
+        limit = speed + self.view_ahead
+        while self.next_index < len(objects) and depths[self.next_index] < limit:
+            record = objects[self.next_index]
+            obj = self.spare.pop() if self.spare else RoadObject()
+            obj.depth = float(record["depth"])
+            obj.margin_x = float(record["margin_x"])
+            obj.size = float(record["size"])
+            obj.type = OBJECT_TYPES[record["type"]]
+            obj.color = int(record["color"])
+            self.push(obj)
+            self.next_index += 1
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Create or inspect course files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    make = sub.add_parser("make", help="write the random course of a seed to a file")
+    make.add_argument("seed", type=int)
+    make.add_argument("goal_distance", type=float, help="goal distance in km")
+    make.add_argument("out")
+    make.add_argument("--density", type=float, default=1 / 3, help="roadside objects per depth unit")
+    make.add_argument("--rival-interval", type=int, default=90, help="frames between rival spawns")
+    info = sub.add_parser("info", help="print the contents of a course file")
+    info.add_argument("course")
+    args = parser.parse_args(argv)
+
+    if args.command == "make":
+        Course.save(args.out, args.goal_distance,
+                    *Course.generate(args.seed, args.goal_distance, args.density, args.rival_interval))
+        path = args.out
+    else:
+        path = args.course
+    course = Course.load(path)
+    print(f"{path}: id {course.course_id:08x}, goal {course.goal_distance}km, "
+          f"{len(course.curves)} curves, {len(course.objects)} objects, {len(course.spawns)} rivals")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
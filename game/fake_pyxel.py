@@ -0,0 +1,291 @@
+"""ベンチマーク用の pyxel の代わり。ウィンドウを開かずに描画・サウンド API の
+呼び出し回数を数え、rasterize = True なら NumPy のフレームバッファに簡易的に描き込む"""
+from collections import Counter
+import ctypes
+import numpy as np
+
+width = 0
+height = 0
+frame_count = 0
+rasterize = False
+calls = Counter()  # API ごとの呼び出し回数
+screen = None
+
+# 画面への描画命令（1フレームあたりの描画コール数に数えるもの）
+DRAW_CALLS = ("cls", "rect", "rectb", "line", "pset", "circ", "circb", "tri", "text", "blt")
+
+_keys = {}
+_held = set()
+_prev_held = set()
+_camera = (0, 0)
+_pal = np.arange(256, dtype=np.uint8)
+
+
+def __getattr__(name):
+    # KEY_xxx は使われた順に番号を振る
+    if name.startswith("KEY_"):
+        return _keys.setdefault(name, len(_keys) + 1)
+    raise AttributeError(name)
+
+
+def set_held_keys(keys):
+    global _held, _prev_held
+    _prev_held, _held = _held, set(keys)
+
+
+def end_frame():
+    global frame_count
+    frame_count += 1
+
+
+def reset_counters():
+    calls.clear()
+
+
+def draw_calls():
+    return sum(calls[name] for name in DRAW_CALLS)
+
+
+class Canvas:
+    def __init__(self, w, h):
+        self.width, self.height = w, h
+        self.data = np.zeros((h, w), dtype=np.uint8)
+
+    def _fill(self, x0, y0, x1, y1, col):
+        x0, y0 = max(int(x0), 0), max(int(y0), 0)
+        x1, y1 = min(int(x1), self.width), min(int(y1), self.height)
+        if x0 < x1 and y0 < y1:
+            self.data[y0:y1, x0:x1] = col
+
+    def _pset(self, x, y, col):
+        x, y = int(x), int(y)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.data[y, x] = col
+
+    def _line(self, x1, y1, x2, y2, col):
+        n = int(max(abs(x2 - x1), abs(y2 - y1))) + 1
+        xs = np.linspace(x1, x2, n).astype(np.int64)
+        ys = np.linspace(y1, y2, n).astype(np.int64)
+        ok = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        self.data[ys[ok], xs[ok]] = col
+
+    def _circ(self, x, y, r, col):
+        x0, y0 = max(int(x - r), 0), max(int(y - r), 0)
+        x1, y1 = min(int(x + r) + 1, self.width), min(int(y + r) + 1, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        gy, gx = np.mgrid[y0:y1, x0:x1]
+        mask = (gx - x) ** 2 + (gy - y) ** 2 <= r * r
+        self.data[y0:y1, x0:x1][mask] = col
+
+    def _tri(self, x1, y1, x2, y2, x3, y3, col):
+        x0, y0 = max(int(min(x1, x2, x3)), 0), max(int(min(y1, y2, y3)), 0)
+        xe, ye = min(int(max(x1, x2, x3)) + 1, self.width), min(int(max(y1, y2, y3)) + 1, self.height)
+        if x0 >= xe or y0 >= ye:
+            return
+        gy, gx = np.mgrid[y0:ye, x0:xe]
+        d1 = (gx - x2) * (y1 - y2) - (x1 - x2) * (gy - y2)
+        d2 = (gx - x3) * (y2 - y3) - (x2 - x3) * (gy - y3)
+        d3 = (gx - x1) * (y3 - y1) - (x3 - x1) * (gy - y1)
+        neg = (d1 < 0) | (d2 < 0) | (d3 < 0)
+        pos = (d1 > 0) | (d2 > 0) | (d3 > 0)
+        self.data[y0:ye, x0:xe][~(neg & pos)] = col
+
+    def _blt(self, x, y, src, u, v, w, h, colkey=None, scale=None, pal=None):
+        w, h = int(w), int(h)
+        if w == 0 or h == 0:
+            return
+        region = src.data[int(v):int(v) + abs(h), int(u):int(u) + abs(w)]
+        if w < 0: region = region[:, ::-1]
+        if h < 0: region = region[::-1, :]
+        if scale and scale != 1:
+            # 中心を基準に最近傍で拡大縮小
+            sh, sw = max(int(region.shape[0] * scale), 1), max(int(region.shape[1] * scale), 1)
+            rows = (np.arange(sh) / scale).astype(np.int64).clip(0, region.shape[0] - 1)
+            cols = (np.arange(sw) / scale).astype(np.int64).clip(0, region.shape[1] - 1)
+            region = region[rows][:, cols]
+            x += (abs(w) - sw) / 2
+            y += (abs(h) - sh) / 2
+        x, y = int(x), int(y)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + region.shape[1], self.width), min(y + region.shape[0], self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        part = region[y0 - y:y1 - y, x0 - x:x1 - x]
+        mask = np.ones(part.shape, dtype=bool) if colkey is None else part != colkey
+        values = part if pal is None else pal[part]
+        self.data[y0:y1, x0:x1][mask] = values[mask]
+
+
+class Image(Canvas):
+    def data_ptr(self):
+        return self.data.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8))
+
+    def load(self, x, y, filename):
+        calls["img.load"] += 1
+
+    def cls(self, col):
+        calls["img.cls"] += 1
+        if rasterize: self.data[:] = col
+
+    def pset(self, x, y, col):
+        calls["img.pset"] += 1
+        if rasterize: self._pset(x, y, col)
+
+    def line(self, x1, y1, x2, y2, col):
+        calls["img.line"] += 1
+        if rasterize: self._line(x1, y1, x2, y2, col)
+
+    def rect(self, x, y, w, h, col):
+        calls["img.rect"] += 1
+        if rasterize: self._fill(x, y, x + w, y + h, col)
+
+    def circ(self, x, y, r, col):
+        calls["img.circ"] += 1
+        if rasterize: self._circ(x, y, r, col)
+
+    def blt(self, x, y, img, u, v, w, h, colkey=None, rotate=None, scale=None):
+        calls["img.blt"] += 1
+        if rasterize: self._blt(x, y, _image(img), u, v, w, h, colkey, scale)
+
+
+class Sound:
+    def __init__(self):
+        self.notes = [0] * 16
+        self.volumes = [0] * 16
+
+    def set(self, notes, tones, volumes, effects, speed):
+        calls["sound.set"] += 1
+
+
+class Colors:
+    def __init__(self):
+        self.values = [0x000000, 0x2B335F, 0x7E2072, 0x19959C, 0x8B4852, 0x395C98, 0xA9C1FF, 0xEEEEEE,
+                       0xD4186C, 0xD38441, 0xE9C35B, 0x70C6A9, 0x7696DE, 0xA3A3A3, 0xFF9798, 0xEDC7B0]
+
+    def to_list(self):
+        return list(self.values)
+
+    def from_list(self, values):
+        self.values = list(values)
+
+
+images = [Image(256, 256) for _ in range(3)]
+sounds = [Sound() for _ in range(64)]
+colors = Colors()
+
+
+def _image(img):
+    return images[img] if isinstance(img, int) else img
+
+
+def init(w, h, **kwargs):
+    global width, height, screen
+    width, height = w, h
+    screen = Canvas(w, h)
+
+
+def run(update, draw):
+    # ループはベンチマーク側で回す
+    calls["run"] += 1
+
+
+def quit():
+    calls["quit"] += 1
+
+
+def btn(key):
+    return key in _held
+
+
+def btnp(key, hold=None, repeat=None):
+    return key in _held and key not in _prev_held
+
+
+def play(ch, snd, loop=False):
+    calls["play"] += 1
+
+
+def stop(ch=None):
+    calls["stop"] += 1
+
+
+def play_pos(ch):
+    return None
+
+
+def camera(x=0, y=0):
+    global _camera
+    calls["camera"] += 1
+    _camera = (x, y)
+
+
+def pal(col1=None, col2=None):
+    calls["pal"] += 1
+    if col1 is None:
+        _pal[:] = np.arange(256)
+    else:
+        _pal[col1] = col2
+
+
+def cls(col):
+    calls["cls"] += 1
+    if rasterize: screen.data[:] = _pal[col]
+
+
+def rect(x, y, w, h, col):
+    calls["rect"] += 1
+    if rasterize:
+        cx, cy = _camera
+        screen._fill(x - cx, y - cy, x - cx + w, y - cy + h, _pal[col])
+
+
+def rectb(x, y, w, h, col):
+    calls["rectb"] += 1
+    if rasterize:
+        cx, cy = _camera
+        x, y, c = x - cx, y - cy, _pal[col]
+        screen._fill(x, y, x + w, y + 1, c)
+        screen._fill(x, y + h - 1, x + w, y + h, c)
+        screen._fill(x, y, x + 1, y + h, c)
+        screen._fill(x + w - 1, y, x + w, y + h, c)
+
+
+def line(x1, y1, x2, y2, col):
+    calls["line"] += 1
+    if rasterize:
+        cx, cy = _camera
+        screen._line(x1 - cx, y1 - cy, x2 - cx, y2 - cy, _pal[col])
+
+
+def pset(x, y, col):
+    calls["pset"] += 1
+    if rasterize:
+        cx, cy = _camera
+        screen._pset(x - cx, y - cy, _pal[col])
+
+
+def circ(x, y, r, col):
+    calls["circ"] += 1
+    if rasterize:
+        cx, cy = _camera
+        screen._circ(x - cx, y - cy, r, _pal[col])
+
+
+def tri(x1, y1, x2, y2, x3, y3, col):
+    calls["tri"] += 1
+    if rasterize:
+        cx, cy = _camera
+        screen._tri(x1 - cx, y1 - cy, x2 - cx, y2 - cy, x3 - cx, y3 - cy, _pal[col])
+
+
+def text(x, y, s, col):
+    # 文字は描かずに数えるだけ
+    calls["text"] += 1
+
+
+def blt(x, y, img, u, v, w, h, colkey=None, rotate=None, scale=None):
+    calls["blt"] += 1
+    if rasterize:
+        cx, cy = _camera
+        screen._blt(x - cx, y - cy, _image(img), u, v, w, h, colkey, scale, _pal)
@@ -0,0 +1,73 @@
+import math
+import pyxel
+
+COLKEY = 229  # 透明色（車のスプライトと同じ）
+
+
+class RpmGauge:
+    """タコメーターの静的な部分と、RPM の角度(0〜180度)ごとの点灯アークを
+    起動時に画像へ焼き込んでおき、毎フレームは blt 2 回で描く"""
+    def __init__(self, mx, my, r):
+        self.mx, self.my, self.r = mx, my, r
+        # 画像の左上 = 画面上の (ox, oy)
+        self.ox, self.oy = mx - r - 12, my - r - 13
+        self.w = (r + 12) * 2 + 1
+        self.face_h = (r + 13) + r + 3
+        self.arc_h = r + 14
+        self.face = pyxel.Image(self.w, self.face_h)
+        self.bake_face()
+        # 点灯アーク：角度 d の画像は 0〜d-1 度まで点灯したもの
+        self.cols = 256 // self.w
+        rows = (181 + self.cols - 1) // self.cols
+        self.arc = pyxel.Image(self.w * self.cols, self.arc_h * rows)
+        self.arc_uv = [((d % self.cols) * self.w, (d // self.cols) * self.arc_h) for d in range(181)]
+        self.bake_arcs()
+
+    def bake_face(self):
+        img, mx, my, r = self.face, self.mx - self.ox, self.my - self.oy, self.r
+        img.cls(COLKEY)
+        # --- 1. RPMメーターの背景 ---
+        # 隙間を埋めるため、0.1度刻みでループを回し、少し内側(r+2)から塗り始める
+        deg = 180.0
+        while deg <= 360.0:
+            rad = math.radians(deg)
+            # 内側の境界をr+2、外側をr+11に設定
+            x1 = mx + math.cos(rad) * (r + 2)
+            y1 = my - 1 + math.sin(rad) * (r + 2)
+            x2 = mx + math.cos(rad) * (r + 11)
+            y2 = my - 1 + math.sin(rad) * (r + 11)
+            img.line(x1, y1, x2, y2, 0)
+            deg += 0.1
+        # --- 2. スピードメーターの文字盤 ---
+        img.circ(mx, my, r + 2, 0)
+        img.circ(mx, my, r, 5)
+        # 目盛り
+        for a in range(135, 406, 45):
+            rad = math.radians(a)
+            img.line(mx + math.cos(rad)*(r-3), my + math.sin(rad)*(r-3),
+                     mx + math.cos(rad)*r, my + math.sin(rad)*r, 7)
+
+    def bake_arcs(self):
+        mx, my, r = self.mx - self.ox, self.my - self.oy, self.r
+        # 1度ぶんのドット（インジケーターの太さ 4〜9）を先に計算しておく
+        dots = []
+        for i in range(180):
+            rad = math.radians(180 + i)
+            # 色の変化（150度/80%以上で赤）
+            col = 8 if i > 150 else (10 if i > 110 else 11)
+            dots.append([(mx + math.cos(rad) * (r + thick), my - 1 + math.sin(rad) * (r + thick), col)
+                         for thick in range(4, 10)])
+        self.arc.cls(COLKEY)
+        for d in range(1, 181):
+            u, v = self.arc_uv[d]
+            for i in range(d):
+                for px, py, col in dots[i]:
+                    self.arc.pset(u + px, v + py, col)
+
+    def draw(self, rpm):
+        # rpm (0.0~1.0) を 0~180度の範囲に変換
+        angle = max(0, min(int(rpm * 180), 180))
+        pyxel.blt(self.ox, self.oy, self.face, 0, 0, self.w, self.face_h, COLKEY)
+        if angle > 0:
+            u, v = self.arc_uv[angle]
+            pyxel.blt(self.ox, self.oy, self.arc, u, v, self.w, self.arc_h, COLKEY)
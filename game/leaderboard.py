@@ -0,0 +1,69 @@
+"""距離・AT/MT・昼夜ごとの上位 N 件の表。
+
+記録を1件足すたびに該当する表だけを二分探索で更新するので、表示のたびに
+全記録を並べ直す必要はない。表は RecordStore の索引（records.json）に一緒に保存される。
+
+    python leaderboard.py            # 全部の表を表示
+    python leaderboard.py 5.0        # 5.0km の表だけ
+"""
+import bisect
+import sys
+import time
+
+TOP_N = 10
+
+
+def leaderboard_key(distance, is_automatic, night):
+    # 例: "5.0|MT|day"
+    return f"{float(distance)}|{'AT' if is_automatic else 'MT'}|{'night' if night else 'day'}"
+
+
+class Leaderboard:
+    """tables: キーごとの記録のリスト（タイムの速い順、最大 size 件）"""
+    def __init__(self, size=TOP_N, tables=None):
+        self.size = size
+        self.tables = tables or {}
+        # 二分探索用のタイムだけの列
+        self.times = {key: [record["time"] for record in table] for key, table in self.tables.items()}
+
+    def insert(self, record):
+        # 入った順位（0 = 1位）を返す。条件の分からない記録や圏外なら None
+        if record["automatic"] is None:
+            return None
+        key = leaderboard_key(record["distance"], record["automatic"], record["night"])
+        table = self.tables.setdefault(key, [])
+        times = self.times.setdefault(key, [])
+        rank = bisect.bisect_right(times, record["time"])  # 同タイムなら先に出した記録が上
+        if rank >= self.size:
+            return None
+        table.insert(rank, record)
+        times.insert(rank, record["time"])
+        del table[self.size:], times[self.size:]
+        return rank
+
+    def top(self, distance, is_automatic, night, n=TOP_N):
+        return self.tables.get(leaderboard_key(distance, is_automatic, night), [])[:n]
+
+
+def format_table(key, table):
+    lines = [key]
+    for rank, record in enumerate(table, 1):
+        date = time.strftime("%Y-%m-%d", time.localtime(record.get("date") or 0))
+        lines.append(f"{rank:3}. {record['time']:8.2f}s  car {record['car']!s:>3}  {date}")
+    return "\n".join(lines)
+
+
+def main(argv):
+    from records import RecordStore  # records は leaderboard を使うので、ここで読む
+    if len(argv) > 1:
+        print("usage: python leaderboard.py [DISTANCE]")
+        return 2
+    leaderboard = RecordStore(read_only=True).leaderboard
+    for key in sorted(leaderboard.tables, key=lambda k: (float(k.split("|")[0]), k)):
+        if not argv or float(key.split("|")[0]) == float(argv[0]):
+            print(format_table(key, leaderboard.tables[key]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,18 +1,51 @@
 import pyxel
 import math
+import argparse
+import atexit
 import random
-import json
 import os
+import time
+import numpy as np
+from simulation import (Simulation, FPS, INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT,
+                        INPUT_GEAR_UP, INPUT_GEAR_DOWN, INPUT_NITRO)
+from road import RoadProjection, RoadRaster
+from gauge import RpmGauge
+from particles import ParticlePool
+from render_queue import RenderQueue, KIND_OBJECT, KIND_RIVAL, KIND_PLAYER
+from replay import Recorder, Replay, replay_path
+from course import Course
+from profiler import FrameProfiler
+from records import RecordStore, record_key
+from leaderboard import TOP_N
+from palette import Palette, CAR_COLORS, extended_colors
+from traffic import RIVAL_COLORS
+from atlas import SpriteAtlas, CAR_FRAMES
+
+SIM_DT = 1 / FPS  # シミュレーション1ステップの時間（描画の fps とは別）
+MAX_FRAME_TIME = 0.25  # 処理が詰まったときに追いつく時間の上限（秒）
+
+
+class Cloud:
+    __slots__ = ("x", "y", "depth", "u", "v", "orig_w", "orig_h", "speed_factor")
+
+    def __init__(self, x, y, depth, u, v, orig_w, orig_h, speed_factor):
+        self.x, self.y, self.depth = x, y, depth
+        self.u, self.v, self.orig_w, self.orig_h = u, v, orig_w, orig_h
+        self.speed_factor = speed_factor
+
+
 class App:
-    GEAR_SETTINGS = [
-                {"accel": 1.0,  "max_vel": 0.15},
-                {"accel": 0.7,  "max_vel": 0.30},
-                {"accel": 0.5,  "max_vel": 0.45},
-                {"accel": 0.35, "max_vel": 0.55},
-                {"accel": 0.30,  "max_vel": 0.70},
-            ]
-    def __init__(self):
-        self.save_file = "best_times.json"
+    # キーとシミュレーション入力ビットの対応
+    INPUT_KEYS = [
+        (pyxel.KEY_UP, INPUT_UP),
+        (pyxel.KEY_DOWN, INPUT_DOWN),
+        (pyxel.KEY_LEFT, INPUT_LEFT),
+        (pyxel.KEY_RIGHT, INPUT_RIGHT),
+        (pyxel.KEY_E, INPUT_GEAR_UP),
+        (pyxel.KEY_Q, INPUT_GEAR_DOWN),
+        (pyxel.KEY_SPACE, INPUT_NITRO),
+    ]
+    def __init__(self, seed=None, course=None, fps=FPS):
         # シーン管理用の定数
         self.STATE_TITLE = 0 #タイトル
         self.STATE_MENU = 1 #メニュー
@@ -23,20 +56,59 @@ class App:
         self.is_night_mode = False
         self.is_automatic = False # オートマフラグ
         self.goal_distance = 5.0
+        self.roadside_density = 1 / 3 # 奥行き1あたりの木・看板の数
+        # ライバル車：同時に走る台数の上限・スポーン間隔（フレーム）・車線の数（0 = 車線なし）
+        self.rival_limit = 3
+        self.rival_interval = 90
+        self.rival_lanes = 0
+        self.fixed_seed = seed # 指定すると毎回同じコース・同じ展開になる
+        self.course = course # コースファイル（Course）。指定するとゴール距離もそれに従う
+        if course:
+            self.goal_distance = course.goal_distance
+        self.playback = None # 再生中のリプレイ（通常プレイ時は None）
         # Pyxelの初期化
-        pyxel.init(200, 150, title="Highway Racer", quit_key=pyxel.KEY_NONE)
+        # fps は描画の回数。レースは何 fps でも SIM_DT 刻みで進むのでタイムは変わらない
+        pyxel.init(200, 150, title="Highway Racer", fps=fps, quit_key=pyxel.KEY_NONE)
+        self.frame_dt = None # 1フレームの時間を固定する（ベンチマーク用）。None なら実際の経過時間
+        self.last_clock = None
         # サウンドの初期設定
         self.setup_sounds()
         # エンジン音再生用の変数
         self.engine_sound_enabled = True
         # パレットと画像のロード
-        self.setup_custom_palette()
+        pyxel.colors.from_list(extended_colors(pyxel.colors.to_list()))
+        # 昼/夜 × 車の色ごとの pal() の置き換え表（ライバルの色とカスタマイズの色は作っておく）
+        self.palette = Palette(RIVAL_COLORS + CAR_COLORS)
         pyxel.images[0].load(0, 0, "car.png")
         pyxel.images[1].load(0, 0, "cloud.png")
         pyxel.images[2].load(0, 0, "title.png")
+        # ライバルは色・コマ・拡大率ごとに焼き込んだ絵を等倍で blt する（False なら毎回拡大縮小する）
+        # レース中に引っかからないよう、car.png を読んだらすぐに焼いておく
+        # 画素に直接書き込めない pyxel では毎回拡大縮小して描く
+        self.use_car_atlas = hasattr(pyxel.images[0], "data_ptr")
+        self.car_atlas = None
+        if self.use_car_atlas:
+            self.car_atlas = SpriteAtlas(pyxel.images[0], self.palette)
+            self.car_atlas.prebake(RIVAL_COLORS, CAR_FRAMES, 0.1 * 1.5, 1.5)
         self.car_color = 195
+        self.road_projection = None
+        # 道路は NumPy でまとめて塗った画像を1回 blt する（False なら1行ずつ rect で描く）
+        self.use_road_raster = True
+        self.road_raster = None
+        self.rpm_gauge = RpmGauge(170, 130, 20)
+        # パーティクルは固定容量の配列で持つ（上限を超えた分は出さない）
+        self.wind_particles = ParticlePool(1024)
+        self.confetti = ParticlePool(256) # 紙吹雪用
+        self.render_queue = RenderQueue()
+        # F1 で処理時間の計測とオーバーレイ表示を切り替える（I/J/K/L で位置を動かす）
+        self.profiler = FrameProfiler()
+        self.profile_file = "frame_profile.csv"
+        # ウィンドウを閉じて終わったときも書き出す（quit() を通るとは限らない）
+        self.profile_dumped = False
+        atexit.register(self.dump_profile)
+        # ゴールタイムの全記録と、条件（距離・AT/MT・昼夜・車の色）ごとのベスト・上位の表
+        self.records = RecordStore()
         self.reset()
-        self.best_times = self.load_best_times()
         pyxel.run(self.update, self.draw)
 
     def setup_sounds(self):
@@ -54,147 +126,95 @@ class App:
         # 5: ニトロ（シュゴーー）
         pyxel.sounds[5].set("c4d4e4g4","s","5","v",5)
 
-    def load_best_times(self):
-        if os.path.exists(self.save_file):
-            try:
-                with open(self.save_file, "r") as f:
-                    data = json.load(f)
-                    # 重要：JSONのキーは必ず文字列なので、数値(float)に変換して復元する
-                    return {float(k): v for k, v in data.items()}
-            except Exception as e:
-                print(f"Load Error: {e}")
-        # ファイルがない、または読み込めない場合のデフォルト
-        return {1.0: None, 3.0: None, 5.0: None, 10.0: None}
-
-    def save_best_times(self):
-        try:
-            with open(self.save_file, "w") as f:
-                # 数値をキーにした辞書を保存
-                json.dump(self.best_times, f)
-        except Exception as e:
-            print(f"Save Error: {e}")
+    def best_time(self, dist):
+        # 今の条件（AT/MT・昼夜・車の色）での dist km のベストタイム
+        return self.records.get(dist, self.is_automatic, self.is_night_mode, self.car_color)
+
+    def best_replay_path(self):
+        # 今の条件でのベストタイムのリプレイ（記録と同じく条件ごとに1つ）
+        return replay_path(record_key(self.goal_distance, self.is_automatic, self.is_night_mode, self.car_color))
+
+    def update_best_label(self):
+        # HUD のベストタイム表示。レース中は変わらないので、開始時と記録が増えたときだけ作る
+        best = self.best_time(self.goal_distance)
+        self.best_label = f"BEST({self.goal_distance}km):"
+        self.best_text = f"{best:.2f}s" if best is not None else "---.--s"
+        self.best_col = 10 if best is not None else 5
 
     def reset(self):
         self.setup_sounds()
-        self.is_respawning = False
-        self.respawn_timer = 0
-        self.gear = 0
-        self.rpm = 0
-        self.display_rpm = 0  # 追加：メーター表示用のRPM
-        self.speed = 0
-        self.car_x = 0
-        self.velocity = 0
-        self.kilometer = 0
-        self.u = 49
-        self.w = 50 
-        self.total_distance = 0.0
-        self.odometer = 0.0
-        self.is_goal = False
-        self.is_braking = False
-        self.is_kanban = False
-        self.is_out = False
+        # レースの状態（物理・ライバル・コース）はシミュレーション側が持つ
+        if self.playback:
+            self.sim = self.playback.make_simulation(self.course)
+            seed = self.sim.seed
+        else:
+            seed = self.fixed_seed if self.fixed_seed is not None else random.randrange(2**32)
+            self.sim = Simulation(self.goal_distance, self.is_automatic,
+                                  roadside_density=self.roadside_density, seed=seed,
+                                  rival_limit=self.rival_limit, rival_interval=self.rival_interval,
+                                  rival_lanes=self.rival_lanes, course=self.course)
+        self.sim.profiler = self.profiler
+        # まだシミュレーションに反映していない時間（秒）。0 以下になるまでステップを進めて、
+        # 描画は1ステップ前と今の状態の間を alpha で補間する
+        self.sim_time = 0.0
+        self.alpha = 1.0
+        self.goal_distance = self.sim.goal_distance # コースファイルのときはその距離になる
+        # 入力を記録しておき、新記録ならリプレイとして保存する
+        self.recorder = Recorder(self.sim)
+        # 見た目だけの乱数（雲・パーティクル・画面の揺れ）はゲーム側の乱数列と分ける
+        self.fx_random = random.Random(f"{seed}:draw")
+        self.fx_rng = np.random.default_rng(seed)
         self.is_new_record = False
+        self.goal_rank = None # 上位の表（距離・AT/MT・昼夜ごと）での順位
+        self.update_best_label()
         self.out_darkness = 0  # コースアウト時の暗さを管理 (0〜100)
         self.car_draw_y = 95
-        self.frame_count = 0
-        self.goal_time = 0
-        self.wind_particles = []
-        self.confetti = [] # 紙吹雪用
-        self.is_boosting = False      # ブースト中かどうかのフラグ
-        self.boost_timer = 0          # ブーストの残り時間
-        self.boost_cooldown = 0       # 次にブーストできるまでの待ち時間
-        self.is_rocket_start = False
-        self.rocket_timer = 0
-        self.rocket_text_timer = 0
-        self.is_stalled = False
-        self.stall_timer = 0
-        self.track_pos = 0
-        self.curve_val = 0
-        self.target_curve = 0
-        self.road_objects = []
+        self.wind_particles.clear()
+        self.confetti.clear()
         self.tree_span = 120.0
         self.dbg_x = 135
         self.dbg_y = 5
-        self.is_spinning = False  # スピン中フラグ
-        self.spin_timer = 0       # スピンの経過時間
-        self.shake_amount = 0  # 衝撃による揺れの強さ
-        self.grass_shake = 0   # 芝生による現在の揺れ幅
-        self.road_objects = []
-        for i in range(40):
-            obj_type = "tree" if random.random() > 0.2 else "sign"
-            side = random.choice([-2.25, 2.25])
-            
-            if obj_type == "sign":
-                # 縁石のすぐ隣（マージン 5〜10）
-                margin = random.uniform(5, 10)
-            else:
-                # 木は少し離れた場所（マージン 20〜50）
-                margin = random.uniform(20, 50)
-            
-            self.road_objects.append({
-                "depth": i * 3.0, 
-                "margin_x": margin * side, # offset_x から margin_x に名前変更
-                "size": random.uniform(1.0, 1.3),
-                "type": obj_type,
-                "color": random.choice([10, 12, 14])
-            })
-
-        # --- 追加：ライバル車（NPC）の設定 ---
-        self.is_respawning = False
-        self.respawn_timer = 0
-        self.rival_cars = []
-        self.spawn_queue_timer = 0
-        self.start_timer = 200
-        self.track_data = []
-        for _ in range(50):
-            self.track_data.append(random.uniform(-1.5, 1.5))
-            
+        self.vanishing_x = pyxel.width / 2
+        self.vanishing_y = 60
+
         self.clouds = []
         while len(self.clouds) < 5:
-            c_type = random.choice([0, 1])
+            c_type = self.fx_random.choice([0, 1])
             cw, ch, u, v = (45, 15, 0, 0) if c_type == 0 else (30, 20, 0, 15)
-            self.clouds.append({
-                "x": random.uniform(0, pyxel.width),
-                "y": random.uniform(5, 40),
-                "depth": random.uniform(0.1, 0.8),
-                "u": u, "v": v,
-                "orig_w": cw, "orig_h": ch,
-                "speed_factor": random.uniform(0.05, 0.1)
-            })
-
-    def spawn_rival(self, depth):
-        # 色のバリエーションを増加 (2:茶, 14:ピンク, 15:肌色, 12:青, 10:黄, 3:緑)
-        rival_colors = [2, 14, 15, 12, 10, 3, 9, 11]
-        self.rival_cars.append({
-            "depth": depth,
-            "offset_x": random.uniform(-90, 90),
-            "speed_kmh": random.uniform(140, 210), # 速度差を少し縮めて団子状態を防ぐ
-            "col": random.choice(rival_colors),
-            "is_blown": False,
-            "blown_timer": 0
-        })
-
-
-    def setup_custom_palette(self):
-        original_palette = pyxel.colors.to_list()
-        step_val = 0x33
-        new_colors = [
-            ((i % 6) * step_val) + 
-            (((i // 6) % 6) * step_val) * 0x100 + 
-            (((i // 36) % 6) * step_val) * 0x10000 
-            for i in range(1, 216)
-        ]
-        combined_palette = original_palette + new_colors
-        pyxel.colors.from_list(combined_palette[:230])
-    
+            self.clouds.append(Cloud(
+                x=self.fx_random.uniform(0, pyxel.width),
+                y=self.fx_random.uniform(5, 40),
+                depth=self.fx_random.uniform(0.1, 0.8),
+                u=u, v=v,
+                orig_w=cw, orig_h=ch,
+                speed_factor=self.fx_random.uniform(0.05, 0.1)
+            ))
+        # 雲の奥行きは変わらないので、描画順（奥から）に一度だけ並べておく
+        self.clouds.sort(key=lambda c: c.depth)
+
+
+
+    def dump_profile(self):
+        # 計測していたらヒストグラムを書き出す（終了時に1回だけ）
+        if self.profiler.frames and not self.profile_dumped:
+            self.profiler.dump(self.profile_file)
+            self.profile_dumped = True
+
+    def quit(self):
+        self.dump_profile()
+        pyxel.quit()
 
     def update(self):
+        if pyxel.btnp(pyxel.KEY_F1):
+            self.profiler.enabled = not self.profiler.enabled
+        self.profiler.begin("frame")
+        elapsed = self.frame_time()
         if self.state == self.STATE_TITLE:
             if pyxel.btnp(pyxel.KEY_SPACE):
                 self.state = self.STATE_MENU
                 pyxel.play(1, 2) # シーン切り替え音
             if pyxel.btnp(pyxel.KEY_ESCAPE):
-                pyxel.quit()
+                self.quit()
 
         
         elif self.state == self.STATE_MENU:
@@ -212,7 +232,21 @@ class App:
             if pyxel.btnp(pyxel.KEY_SPACE):
                 self.state = self.STATE_PLAY
                 pyxel.play(1, 2)
+                self.playback = None
                 self.reset()
+            if pyxel.btnp(pyxel.KEY_P) and os.path.exists(self.best_replay_path()):
+                # 今の条件でのベストタイムのリプレイを再生
+                try:
+                    playback = Replay.load(self.best_replay_path())
+                    if not playback.matches(self.course):
+                        raise ValueError("replay was recorded on a different course")
+                except ValueError as e:
+                    print(f"Replay Error: {e}") # 古い形式・壊れたファイル・別のコースの記録は再生しない
+                else:
+                    self.playback = playback
+                    self.state = self.STATE_PLAY
+                    pyxel.play(1, 2)
+                    self.reset()
             if pyxel.btnp(pyxel.KEY_ESCAPE):
                 self.state = self.STATE_TITLE
             if pyxel.btnp(pyxel.KEY_N):
@@ -251,306 +285,159 @@ class App:
                 self.state = self.STATE_PAUSE
                 pyxel.stop(0)
                 return
-
-
-            # --- RPMの基本計算（走行中または空ぶかし） ---
-            target_rpm = 0
-            if self.start_timer > 0:
-                # カウントダウン中：UPキーで空ぶかし
-                if pyxel.btn(pyxel.KEY_UP):
-                    target_rpm = 0.9 + random.uniform(-0.05, 0.05) # 針を震わせる
-                else:
-                    target_rpm = 0
-            else:
-                # 走行中：速度とギアに基づく本来のRPM
-                gear_set = self.GEAR_SETTINGS[self.gear]
-                target_rpm = self.velocity / gear_set["max_vel"]
-
-            # 表示用RPMをターゲットに近づける（徐々に戻る・動くロジック）
-            # 0.2 は追従速度。値を小さくするとよりゆっくり戻ります
-            if self.start_timer == 0:
-                real_target_rpm = self.velocity / gear_set["max_vel"]
-                # display_rpm を走行用RPMに徐々に近づける
-                self.display_rpm += (real_target_rpm - self.display_rpm) * 0.1
-            self.display_rpm += (target_rpm - self.display_rpm) * 0.2
-            self.rpm = self.display_rpm # メーター描画ロジックが参照する変数に代入
-
-            
-            if self.STATE_PLAY:
-                # RPMに合わせて音程を決定
-                note = int(12 + self.display_rpm * 24)
-                pyxel.sounds[0].notes[0] = note
-                pyxel.sounds[0].notes[1] = note
-                pyxel.play(0, 0, loop=True)
-            else:
-                # 条件外（ゴールや停止中）なら即座に停止
-                pyxel.stop(0)
-            #オートマチック
-            if self.is_automatic and self.start_timer == 0 and not self.is_goal:
-                if self.rpm > 0.85 and self.gear < 4:
-                    self.gear += 1
-                elif self.rpm < 0.6 and self.gear > 0:
-                    self.gear -= 1
-
-            for c in self.confetti[:]:
-                c["x"] += c["vx"]
-                c["y"] += c["vy"]
-                c["vy"] += 0.05
-                c["angle"] += c["va"]
-                if c["y"] > pyxel.height: self.confetti.remove(c)
-            if self.start_timer > 0:
-                self.start_timer -= 1
-                self.velocity = 0
-                if self.start_timer > 40 and pyxel.btn(pyxel.KEY_UP):
-                    self.is_stalled = True
-                elif not pyxel.btn(pyxel.KEY_UP):
-                    self.is_stalled = False
-                if 10 < self.start_timer < 40 and pyxel.btn(pyxel.KEY_UP):
-                    if not self.is_stalled:
-                     self.is_rocket_start = True
-                elif self.start_timer < 10 and not pyxel.btn(pyxel.KEY_UP):
-                    self.is_rocket_start = False # 離しちゃダメ
-                if self.start_timer == 0:
-                    self.frame_count = 0
-                    if self.is_stalled:
-                        self.stall_timer = 60 # 2秒間動けない
-                        self.velocity = 0
-                    elif self.is_rocket_start:
-                        self.velocity = 0.25
-                        self.rocket_timer = 60
-                        self.rocket_text_timer = 60 # テキスト表示用
-                    self.rival_cars = [] # 初期化
-            else:
-                self.frame_count += 1
-                if len(self.rival_cars) < 3:
-                    if self.spawn_queue_timer > 0:
-                        self.spawn_queue_timer -= 1
-                    else:
-                        self.spawn_rival(800) # 遠く（地平線）にスポーン
-                        self.spawn_queue_timer = 90 # 次のスポーンまで約3秒(90フレーム)待つ
-
-            if self.is_respawning:
-                self.respawn_timer += 1
-                if self.respawn_timer > 30:
-                    self.is_respawning = False
-                    self.car_x = 0
+            sim = self.sim
+            #リスタート（ゴール後・スタート前）
+            if (sim.is_goal or sim.start_timer > 0) and pyxel.btnp(pyxel.KEY_R):
+                self.state = self.STATE_MENU
+                pyxel.stop()
+                self.reset()
                 return
-            #スピン
-            if self.is_spinning:
-                self.spin_timer += 1
-                self.car_x -= self.car_x * 0.1 # 徐々にセンターへ戻る
-            
-                # スピンのアニメーション（向きを強制的に変える）
-                # self.u をタイマーに合わせてループさせることで回転を表現
-                spin_frames = [49, -50, 50, -50] # 標準, 左向き, 右向きなどの切り替え
-                self.u = spin_frames[(self.spin_timer // 2) % 4]
-                self.w = 26 # 旋回用の幅を使用
-            
-                if self.spin_timer > 30: # 1秒弱で復帰
-                    self.is_spinning = False
-                    self.is_kanban = False
-                    self.spin_timer = 0
-                    pyxel.camera(0, 0)
-                if not self.is_kanban:
-                    return # スピン中は操作不能
-
-
-            if not self.is_goal and self.start_timer == 0:
-                if  self.is_stalled:
-                    self.velocity = 0
-                    pyxel.play(1,4)
-                else:
-                    if pyxel.btnp(pyxel.KEY_E): self.gear = min(self.gear + 1, 4)
-                    if pyxel.btnp(pyxel.KEY_Q): self.gear = max(self.gear - 1, 0)
-                    gear_set = self.GEAR_SETTINGS[self.gear]
-                    self.is_braking = False
-                    if pyxel.btn(pyxel.KEY_UP):
-                        if self.velocity < gear_set["max_vel"]:
-                            if not self.is_automatic:
-                                self.velocity += 0.002 * gear_set["accel"]  
-                            else: 
-                                self.velocity += 0.002 * gear_set["accel"] * 0.8
-                        else:
-                            self.velocity = max(self.velocity - 0.001, gear_set["max_vel"])
-                    elif pyxel.btn(pyxel.KEY_DOWN):
-                        self.velocity = max(self.velocity - 0.004, 0)
-                        self.is_braking = True
-                    else:
-                        self.velocity = max(self.velocity - 0.0005, 0)
-                    if pyxel.btnp(pyxel.KEY_SPACE) and self.boost_cooldown == 0 and not self.is_goal:
-                        self.is_boosting = True
-                        self.boost_timer = 30  # 2秒間加速（30fps想定なら60フレーム）
-                        self.boost_cooldown = 300 # 次に使えるまで10秒間のクールダウン
-
-                    if self.is_boosting:
-                        self.velocity = min(self.velocity + 0.005, 0.8) # 通常の最高速(0.7)を超える0.8まで加速
-                        self.boost_timer -= 1
-                        self.wind_particles.append({
-                                "x": pyxel.width / 2 + random.uniform(-10, 10),
-                                "y": 110, 
-                                "vx": random.uniform(-1, 1),      # 左右の散らばり
-                                "vy": random.uniform(2, 5),       # 下方向への勢い
-                                "speed_up": 1.1,                  # 加速感
-                                "col": random.choice([7, 10])
-                        })
-                        
-                        if pyxel.play_pos(2) is None and self.state != self.STATE_PAUSE:
-                            pyxel.play(2, 5, loop=True)
-                        else:
-                            pyxel.stop(2)
-                        if self.boost_timer <= 0:
-                            pyxel.stop(2)
-                            self.is_boosting = False
-
-                    if self.boost_cooldown > 0:
-                        self.boost_cooldown -= 1
-            else:
-                self.is_braking = False
-                if self.start_timer == 0:
-                    self.velocity = max(self.velocity - (self.velocity - 0.05)/100, 0.05)
-                if abs(self.car_x) > 0.1:
-                    self.car_x -= self.car_x * 0.03
-                else:
-                    self.car_x = 0
-                #リスタート
-                if pyxel.btnp(pyxel.KEY_R):
-                    self.state = self.STATE_MENU
-                    pyxel.stop()
-                    self.reset()
-                    return
-
-            gear_set = self.GEAR_SETTINGS[self.gear]
-            self.speed += self.velocity
-            self.kilometer = int(self.velocity * 400)
-
-
-            if not self.is_goal:
-                self.total_distance += self.velocity * 0.005
-                self.odometer = round(self.total_distance, 2)
-
-            self.track_pos += self.velocity * 5
-            current_idx = int(self.track_pos / 150) % len(self.track_data)
-            self.target_curve = self.track_data[current_idx]
-            self.curve_val += (self.target_curve - self.curve_val) * 0.05
-
-            if not self.is_goal:
-                handling_factor = math.sin(max(0, min(self.velocity / 0.6 * math.pi, math.pi)))
-                move_amount = 7.5 * handling_factor
-                if not self.is_spinning:
-                    if pyxel.btn(pyxel.KEY_LEFT): 
-                        self.car_x -= move_amount
-                        self.u, self.w = -50, 26
-                    elif pyxel.btn(pyxel.KEY_RIGHT):
-                        self.car_x += move_amount
-                        self.u, self.w = 50, 26
-                    else:
-                        self.u, self.w = 49, 0
-                self.car_x -= self.curve_val * (self.velocity * 7)
-            else:
-                if self.target_curve < -0.5:     # 左カーブ
-                    self.u, self.w = -50, 26
-                elif self.target_curve > 0.5:    # 右カーブ
-                    self.u, self.w = 50, 26
-                else:                           # 直進
-                    self.u, self.w = 49, 0
-            road_limit = 165
-            if abs(self.car_x) > road_limit and not self.is_goal:
-                self.is_out = True
-                self.grass_shake = random.uniform(-2, 2) * self.velocity * 10
-                if self.velocity > 0.15:
-                    self.velocity = max(self.velocity - 0.005, 0)
-                if abs(self.car_x) > 400:
-                    self.is_respawning = True
-                    self.velocity = 0
-                    self.respawn_timer = 0
-            else:
-                self.is_out = False
-
-            self.vanishing_x = (pyxel.width / 2) + (self.curve_val * 80)
-            self.vanishing_y = 60 
-            self.update_effects()
-
-            if self.odometer >= self.goal_distance and not self.is_goal:
-                pyxel.sounds[0].volumes[0] = 2
-                pyxel.play(3, 3) # ファンファーレ
-                self.is_goal = True
-                self.goal_time = self.frame_count / 30
-                dist = float(self.goal_distance) # 確実に型を合わせる
-                if dist not in self.best_times or self.best_times[dist] is None or self.goal_time < self.best_times[dist]:
-                    self.best_times[dist] = self.goal_time
-                    self.save_best_times() # 保存実行
-                    self.is_new_record = True
-                for _ in range(100):
-                        self.confetti.append({
-                            "x": random.uniform(0, pyxel.width), "y": random.uniform(-100, 0),
-                            "vx": random.uniform(-1, 1), "vy": random.uniform(1, 3),
-                            "col": random.choice([7, 8, 9, 10, 11, 12, 14, 15]),
-                            "angle": random.uniform(0, 360), "va": random.uniform(5, 15)
-                        })
+
+            # 経過した時間の分だけ決まった刻みでシミュレーションを進める（描画が遅れたら追いつく）
+            self.sim_time += elapsed
+            while self.sim_time > 0:
+                self.sim_time -= SIM_DT
+                self.step_sim()
+            self.alpha = 1 + self.sim_time / SIM_DT
+
+            # RPMに合わせて音程を決定
+            note = int(12 + sim.display_rpm * 24)
+            pyxel.sounds[0].notes[0] = note
+            pyxel.sounds[0].notes[1] = note
+            pyxel.play(0, 0, loop=True)
         move_speed = 2
         if pyxel.btn(pyxel.KEY_I): self.dbg_y -= move_speed
         if pyxel.btn(pyxel.KEY_K): self.dbg_y += move_speed
         if pyxel.btn(pyxel.KEY_J): self.dbg_x -= move_speed
         if pyxel.btn(pyxel.KEY_L): self.dbg_x += move_speed
-       
-        for rival in self.rival_cars:
-                rival["offset_x"] += math.sin(pyxel.frame_count * 0.05 + rival["depth"]) * 0.5
-                # 1. 吹き飛び中の特殊処理
-                if rival.get("is_blown"):
-                    pyxel.play(1, 4)
-                    rival["blown_timer"] -= 1
-                    rival["depth"] += 2.0 
-                    if rival["blown_timer"] <= 0:
-                        rival["is_blown"] = False
-                        rival["speed_kmh"] = random.uniform(120, 180)
-                    continue # 吹き飛び中は以下の通常移動をスキップ
-
-                # 2. 【重要】自律走行の計算
-                # 自車の速度に関わらず、ライバルは自分の speed_kmh で進み続けます。
-                # 描画上の位置(depth)は「ライバルの進んだ距離 - 自車の進んだ距離」で決まります。
-                
-                rival_vel_factor = rival["speed_kmh"] / 400  # 秒速的な係数に変換
-                # 自車が 0 でも rival_vel_factor がプラスなら depth は増え（遠ざかり）ます
-                rival["depth"] += (rival_vel_factor - self.velocity) * 100 
-                
-                # 3. リスポーン判定
-                # 後ろに消えた(追い越した)場合、または遠ざかりすぎて見えなくなった場合
-                if rival["depth"] < -200 or rival["depth"] > 900:
-                    self.rival_cars.remove(rival)
-        
+
+    def frame_time(self):
+        # 前回の update からの経過時間（秒）
+        if self.frame_dt is not None:
+            return self.frame_dt
+        now = time.perf_counter()
+        elapsed = 0.0 if self.last_clock is None else now - self.last_clock
+        self.last_clock = now
+        return min(elapsed, MAX_FRAME_TIME)
+
+    def step_sim(self):
+        # シミュレーションと、ゲーム内の時間で動く演出を1ステップ進める
+        sim = self.sim
+        if self.playback:
+            inputs = self.playback.input_at(sim.tick)
+        else:
+            inputs = self.read_inputs()
+        self.recorder.record(inputs)
+        self.handle_sim_events(sim.step(inputs))
+
+        self.confetti.update()
+        self.confetti.cull(y_max=pyxel.height)
+
+        self.vanishing_x = (pyxel.width / 2) + (sim.curve_val * 80)
+        self.vanishing_y = 60
+        self.profiler.begin("effects")
+        self.update_effects()
+        self.profiler.end("effects")
+
+    def read_inputs(self):
+        # 現在のキー状態をシミュレーション用のビットマスクに変換
+        inputs = 0
+        for key, bit in self.INPUT_KEYS:
+            if pyxel.btn(key):
+                inputs |= bit
+        return inputs
+
+    def handle_sim_events(self, events):
+        # シミュレーションからの通知を音や演出に変換する
+        for event in events:
+            if event == "stall" or event == "crash":
+                pyxel.play(1, 4)
+            elif event == "signal":
+                # スタートのシグナル。最後（青になる）だけ1オクターブ高い音（c3 = 36, c4 = 48）
+                pyxel.sounds[1].volumes[0] = 7
+                pyxel.sounds[1].notes[0] = 48 if self.sim.start_timer == 10 else 36
+                pyxel.play(1, 1)
+            elif event == "boost":
+                self.wind_particles.spawn(
+                        x=pyxel.width / 2 + self.fx_random.uniform(-10, 10),
+                        y=110,
+                        vx=self.fx_random.uniform(-1, 1),      # 左右の散らばり
+                        vy=self.fx_random.uniform(2, 5),       # 下方向への勢い
+                        speed_up=1.1,                  # 加速感
+                        col=self.fx_random.choice([7, 10]))
+                if pyxel.play_pos(2) is None:
+                    pyxel.play(2, 5, loop=True)
+                else:
+                    pyxel.stop(2)
+            elif event == "boost_end":
+                pyxel.stop(2)
+            elif event == "spin_end":
+                pyxel.camera(0, 0)
+            elif event == "goal":
+                self.on_goal()
+
+    def on_goal(self):
+        pyxel.sounds[0].volumes[0] = 2
+        pyxel.play(3, 3) # ファンファーレ
+        dist = float(self.goal_distance) # 確実に型を合わせる
+        goal_time = self.sim.goal_time
+        if self.playback:
+            pass # リプレイ再生では記録を更新しない
+        else:
+            best = self.best_time(dist)
+            self.goal_rank = self.records.add(dist, self.is_automatic, self.is_night_mode, self.car_color,
+                                              goal_time, seed=self.sim.seed, # 記録は毎回追記する
+                                              course_id=self.course.course_id if self.course else 0)
+            # 書き込めなかった記録ではベストは変わらないので、新記録にもリプレイの保存にもしない
+            new_best = self.best_time(dist)
+            self.is_new_record = new_best is not None and (best is None or new_best < best)
+            if self.is_new_record:
+                # 条件ごとのベストタイムは検証用のリプレイも残す
+                try:
+                    self.recorder.save(self.best_replay_path())
+                except OSError as e:
+                    print(f"Save Error: {e}")
+            self.update_best_label()
+        rng, n = self.fx_rng, 100
+        self.confetti.spawn(
+            x=rng.uniform(0, pyxel.width, n), y=rng.uniform(-100, 0, n),
+            vx=rng.uniform(-1, 1, n), vy=rng.uniform(1, 3, n),
+            col=rng.choice([7, 8, 9, 10, 11, 12, 14, 15], n),
+            gravity=0.05,
+            angle=rng.uniform(0, 360, n), va=rng.uniform(5, 15, n))
+
     def update_effects(self):
-        if self.kilometer > 150:
-            spawn_count = int((self.kilometer - 150) / 10)
-            for _ in range(spawn_count):
-                angle = random.uniform(0, math.pi * 2)
-                dist = random.uniform(5, 10)
-                self.wind_particles.append({
-                    "x": self.vanishing_x + math.cos(angle) * dist,
-                    "y": self.vanishing_y + math.sin(angle) * dist,
-                    "vx": math.cos(angle) * 3,
-                    "vy": math.sin(angle) * 3,
-                    "speed_up": random.uniform(1.15, 1.3),
-                    "col": random.choice([7, 12, 6])
-                })
-        for p in self.wind_particles[:]:
-            p["x"] += p["vx"]; p["y"] += p["vy"]
-            p["vx"] *= p["speed_up"]; p["vy"] *= p["speed_up"]
-            if p["x"] < -100 or p["x"] > pyxel.width + 100 or p["y"] < -100 or p["y"] > pyxel.height + 100:
-                self.wind_particles.remove(p)
+        sim = self.sim
+        if sim.kilometer > 150:
+            spawn_count = int((sim.kilometer - 150) / 10)
+            rng = self.fx_rng
+            angle = rng.uniform(0, math.pi * 2, spawn_count)
+            dist = rng.uniform(5, 10, spawn_count)
+            cos, sin = np.cos(angle), np.sin(angle)
+            self.wind_particles.spawn(
+                x=self.vanishing_x + cos * dist,
+                y=self.vanishing_y + sin * dist,
+                vx=cos * 3,
+                vy=sin * 3,
+                speed_up=rng.uniform(1.15, 1.3, spawn_count),
+                col=rng.choice([7, 12, 6], spawn_count))
+        self.wind_particles.update()
+        self.wind_particles.cull(-100, pyxel.width + 100, -100, pyxel.height + 100)
 
         for c in self.clouds:
-            c["x"] += self.velocity * c["speed_factor"] * 10
-            c["x"] -= self.curve_val * (1.0 - c["depth"]) * self.velocity * 10
-            c["x"] += (self.car_x * 0.01) * (1.0 - c["depth"]) * self.velocity * 2
-            if c["x"] < -100: c["x"] = pyxel.width + 100
-            if c["x"] > pyxel.width + 100: c["x"] = -100
+            c.x += sim.velocity * c.speed_factor * 10
+            c.x -= sim.curve_val * (1.0 - c.depth) * sim.velocity * 10
+            c.x += (sim.car_x * 0.01) * (1.0 - c.depth) * sim.velocity * 2
+            if c.x < -100: c.x = pyxel.width + 100
+            if c.x > pyxel.width + 100: c.x = -100
 
     def draw(self):
-        sh_x = random.uniform(-self.shake_amount, self.shake_amount) + self.grass_shake
-        sh_y = random.uniform(-self.shake_amount, self.shake_amount)
+        sim = self.sim
+        sh_x = self.fx_random.uniform(-sim.shake_amount, sim.shake_amount) + sim.grass_shake
+        sh_y = self.fx_random.uniform(-sim.shake_amount, sim.shake_amount)
         
         # 画面全体を揺らす
-        pyxel.pal()
+        self.palette.reset()
         pyxel.cls(0)
         if self.state == self.STATE_TITLE:
             self.draw_title_screen()
@@ -560,38 +447,59 @@ class App:
             self.draw_customize_screen()
         elif self.state == self.STATE_PLAY or self.STATE_PAUSE:
             self.draw_game_scene()
-            for c in self.confetti:
-                self.draw_confetti(c["x"], c["y"], 3, c["col"], c["angle"])
-            if self.is_spinning:
+            self.draw_confetti(3)
+            if sim.is_spinning:
                 pyxel.camera(sh_x, sh_y)
-            elif self.is_out:
+            elif sim.is_out:
                 pyxel.camera(sh_x, sh_y)
-            elif self.is_boosting:
-                sh_x = random.uniform(-2, 2)
-                sh_y = random.uniform(-2, 2)
+            elif sim.is_boosting:
+                sh_x = self.fx_random.uniform(-2, 2)
+                sh_y = self.fx_random.uniform(-2, 2)
             else:    
                 pyxel.camera(0, 0)
-            if not self.is_goal:
+            if not sim.is_goal:
                 gx, gy = 140, 10  # ゲージの開始位置
                 gw, gh = 50, 6    # ゲージのサイズ
                 # 外枠
                 pyxel.rectb(gx, gy, gw, gh, 7)
-                if self.is_boosting:
+                if sim.is_boosting:
                     # ブースト中：残り時間に応じてオレンジのゲージが減っていく
-                    fill_w = (self.boost_timer / 60) * (gw - 2)
+                    fill_w = (sim.boost_timer / 60) * (gw - 2)
                     pyxel.rect(gx + 1, gy + 1, fill_w, gh - 2, 9) # オレンジ
                     pyxel.text(gx - 25, gy, "NITRO!!", pyxel.frame_count % 16)
                 else:
                     # チャージ中：クールダウンに応じて水色のゲージが増えていく
                     # (150 - cooldown) / 150 で溜まり具合を計算
-                    charge_pct = (150 - self.boost_cooldown) / 150
+                    charge_pct = (150 - sim.boost_cooldown) / 150
                     fill_w = charge_pct * (gw - 2)
-                    col = 11 if self.boost_cooldown == 0 else 12 # 溜まったら明るい水色
+                    col = 11 if sim.boost_cooldown == 0 else 12 # 溜まったら明るい水色
                     pyxel.rect(gx + 1, gy + 1, fill_w, gh - 2, col)
-                    pyxel.text(gx - 25, gy, "READY", 7 if self.boost_cooldown == 0 else 5)
+                    pyxel.text(gx - 25, gy, "READY", 7 if sim.boost_cooldown == 0 else 5)
                 
             if self.state == self.STATE_PAUSE:
                 self.draw_pause_overlay()
+        if self.profiler.enabled:
+            self.draw_profiler_overlay()
+        self.profiler.end("frame")
+        self.profiler.end_frame()
+
+    def draw_profiler_overlay(self):
+        # 処理ごとの直近 p50（緑の棒）と p99（赤の線）。棒の全長 = 10ms
+        prof = self.profiler
+        w, h = 92, len(prof.phases) * 8 + 4
+        ox = max(0, min(self.dbg_x, pyxel.width - w))
+        oy = max(0, min(self.dbg_y, pyxel.height - h))
+        pyxel.rect(ox, oy, w, h, 0)
+        pyxel.rectb(ox, oy, w, h, 5)
+        bar_x, bar_w = ox + 54, 36
+        for i, name in enumerate(prof.phases):
+            y = oy + 3 + i * 8
+            p50 = prof.percentile(name, 0.5)
+            p99 = prof.percentile(name, 0.99)
+            col = 10 if name == "frame" else 7
+            pyxel.text(ox + 2, y, f"{name[:6]:6}{p99:5.1f}", col)
+            pyxel.rect(bar_x, y + 1, min(p50 / 10, 1) * bar_w, 4, 11)
+            pyxel.rect(bar_x + min(p99 / 10, 1) * (bar_w - 1), y, 1, 6, 8)
 
     def draw_pause_overlay(self):
         # 中央のメニュー枠
@@ -617,28 +525,26 @@ class App:
         pyxel.text(mx + 30, my + 65, "PRESS [R] TO RESTART", 6)
         pyxel.text(mx + 27, my + 75, "PRESS [ESC] TO RESUME", 6)
 
-    def draw_confetti(self, x, y, size, col, angle):
+    def draw_confetti(self, size):
         """四角形の4つの角を計算して線で結ぶ（塗りつぶしは中央に点を打つ）"""
-        rad = math.radians(angle)
-        s, c = math.sin(rad), math.cos(rad)
+        pool = self.confetti
+        n = pool.count
+        if n == 0:
+            return
+        x, y = pool.x[:n], pool.y[:n]
+        rad = np.radians(pool.angle[:n])
         half = size / 2
-        
-        # 四隅の相対座標
-        pts = [
-            (-half * c - half * s, -half * s + half * c),
-            ( half * c - half * s,  half * s + half * c),
-            ( half * c + half * s,  half * s - half * c),
-            (-half * c + half * s, -half * s - half * c)
-        ]
-        
-        # 絶対座標に変換して線で描画
-        for i in range(4):
-            x1, y1 = x + pts[i][0], y + pts[i][1]
-            x2, y2 = x + pts[(i + 1) % 4][0], y + pts[(i + 1) % 4][1]
-            pyxel.line(x1, y1, x2, y2, col)
-        
-        # 簡易塗りつぶし（中心を塗りつぶす）
-        pyxel.pset(x, y, col)
+        hs, hc = half * np.sin(rad), half * np.cos(rad)
+
+        # 四隅の絶対座標 (4, n)
+        xs = np.array([x - hc - hs, x + hc - hs, x + hc + hs, x - hc + hs]).T.tolist()
+        ys = np.array([y - hs + hc, y + hs + hc, y + hs - hc, y - hs - hc]).T.tolist()
+
+        # 線で描画し、簡易塗りつぶし（中心を塗りつぶす）
+        for px, py, cx, cy, col in zip(xs, ys, x.tolist(), y.tolist(), pool.col[:n].tolist()):
+            for i in range(4):
+                pyxel.line(px[i], py[i], px[i - 3], py[i - 3], col)
+            pyxel.pset(cx, cy, col)
 
 
     def draw_title_screen(self):
@@ -662,6 +568,8 @@ class App:
         else:
             pyxel.text(60, 105, "SPACE: START GAME", 7)
         pyxel.text(60, 115, "ESC: BACK", 6)
+        has_replay = os.path.exists(self.best_replay_path())
+        pyxel.text(100, 115, "P: REPLAY BEST", 6 if has_replay else 5)
         pyxel.text(40, 50, f"[C] CUSTOMIZE CAR COLOR", 14) # カスタマイズへの案内
         mode_text = "NIGHT" if self.is_night_mode else "DAY"
         mode_col = 12 if self.is_night_mode else 10 # 夜なら青、昼なら黄色っぽく
@@ -672,7 +580,7 @@ class App:
         pyxel.text(75, 30, "CAR CUSTOMIZE", 14)
         
         # 色見本
-        colors = [195, 12, 10, 11, 14]
+        colors = CAR_COLORS
         for i, col in enumerate(colors):
             pyxel.rect(40 + i*25, 50, 20, 20, col)
             pyxel.text(48 + i*25, 75, str(i+1), 7)
@@ -680,39 +588,28 @@ class App:
         # 現在の車のプレビュー
         pyxel.text(60, 95, "CURRENT COLOR:", 7)
         pyxel.rect(117, 93, 21, 16, 13)
-        pyxel.pal(195, self.car_color)
+        self.palette.apply(self.palette.profile(False, self.car_color))
         pyxel.blt(103, 90, 0, 0, 0, 50, 24, 229,scale=0.5)
         pyxel.text(60, 115, "PRESS [ESC] TO BACK", 6)
 
     
     
     def draw_single_object(self, obj, obj_y_screen, horizon):
+        sim = self.sim
         obj_perspective = (obj_y_screen - horizon) / (pyxel.height - horizon)
         night_visibility = 0.4 if self.is_night_mode else 0.05
         
         if night_visibility < obj_perspective < 1.0:
-            curve_off = self.curve_val * (1 - obj_perspective)**3 * 80
-            road_center_at_y = (pyxel.width / 2) + curve_off - (self.car_x * obj_perspective)
-            current_road_half_width = (10 + (obj_perspective * 100) * 1.5)
-            side = 1 if obj["margin_x"] > 0 else -1
-            if obj["type"] == "sign":
-                # 縁石の幅(edge_w)を考慮して少し外側に配置
-                edge_w = 5 * obj_perspective + 3
-                # 縁石の端 + わずかなマージン（遠近感を考慮）
-                offset_from_center = current_road_half_width + edge_w + (2 * obj_perspective)
-                obj_x = road_center_at_y + (offset_from_center * side)
-            else:
-                # 木は従来通り、ランダムなマージンを持たせる
-                obj_x = road_center_at_y + (current_road_half_width * side) + (obj["margin_x"] * obj_perspective)
-            
+            obj_x = sim.object_screen_x(obj, obj_perspective, self.view_car_x)
+
             # スケール制限
             adjusted_perspective = math.pow(obj_perspective, 1.2)
-            raw_scale = adjusted_perspective * obj["size"] * 2.5
+            raw_scale = adjusted_perspective * obj.size * 2.5
             MAX_SCALE = 2.5
             scale = min(raw_scale, MAX_SCALE)
             
             # 描画処理 (tree / sign)
-            if obj["type"] == "tree":
+            if obj.type == "tree":
                 trunk_w, trunk_h = max(1, int(4 * scale)), max(1, int(12 * scale))
                 leaf_s = max(1, int(10 * scale))
                 pyxel.rect(obj_x - trunk_w // 2, obj_y_screen - trunk_h, trunk_w, trunk_h, 4)
@@ -723,162 +620,154 @@ class App:
                 pole_h = max(1, int(20 * scale))
                 sign_w, sign_h = max(2, int(12 * scale)), max(2, int(8 * scale))
                 pyxel.rect(obj_x - 1, obj_y_screen - pole_h, max(1, int(2 * scale)), pole_h, 4)
-                pyxel.rect(obj_x - sign_w // 2, obj_y_screen - pole_h, sign_w, sign_h, obj["color"])
+                pyxel.rect(obj_x - sign_w // 2, obj_y_screen - pole_h, sign_w, sign_h, obj.color)
                 pyxel.rectb(obj_x - sign_w // 2, obj_y_screen - pole_h, sign_w, sign_h, 7)
 
-            # --- 衝突判定とペナルティの分岐 ---
-            if 0.75 < obj_perspective < 0.85:
-                # 判定幅（車の中心からの距離）
-                hit_range = 15 if obj["type"] == "tree" else 12
-                
-                if abs(obj_x - pyxel.width / 2) < hit_range:
-                    if not self.is_spinning:
-                        if obj["type"] == "tree":
-                            # 【木】速度をゼロにする
-                            self.velocity = 0
-                            self.shake_amount = 8  # 衝撃大
-                            # スピンさせて操作不能にする
-                            self.is_spinning = True
-                            self.spin_timer = 0
-                        else:
-                            self.velocity = max(self.velocity - 0.075, 0.05)
-                            self.is_spinning = True
-                            self.is_kanban = True
-                            self.shake_amount = 4
+    def get_road_projection(self, horizon):
+        # 起動時と画面サイズが変わったときだけ道路の行テーブルを作り直す
+        if self.road_projection is None or not self.road_projection.matches(pyxel.width, pyxel.height, horizon):
+            self.road_projection = RoadProjection(pyxel.width, pyxel.height, horizon)
+        return self.road_projection
+
+    def get_road_raster(self, horizon):
+        projection = self.get_road_projection(horizon)
+        if self.road_raster is None or self.road_raster.projection is not projection:
+            image = pyxel.Image(projection.width, len(projection.rows))
+            if not hasattr(image, "data_ptr"):
+                # 画素に直接書き込めない pyxel では rect での描画に戻す
+                self.use_road_raster = False
+                return None
+            self.road_raster = RoadRaster(projection, image)
+        return self.road_raster
+
+    def draw_road_rows(self, horizon):
+        # 1行ずつ rect で描く（RoadRaster が使えないとき用）
+        sim = self.sim
+        road_rows = self.get_road_projection(horizon).rows
+        half_w = pyxel.width / 2
+        seg_offset = self.view_speed * 2
+        curve_val, car_x = sim.curve_val, self.view_car_x
+        color_idx = 7 if self.is_night_mode else 6
+        for row in road_rows:
+            y, perspective, inv_perspective, curve_k, road_width, edge_w = row[:6]
+            grass_col, road_col, line_white, line_col, edge_white, edge_col = row[color_idx]
+            if int(inv_perspective + seg_offset) % 2 == 0:
+                line_col, edge_col = line_white, edge_white
+            center_x = half_w + curve_val * curve_k - car_x * perspective
+
+            # 地面・道路のライン描画
+            pyxel.rect(0, y, pyxel.width, 1, grass_col)
+            pyxel.rect(center_x - road_width, y, road_width * 2, 1, road_col)
+            pyxel.rect(center_x - road_width - edge_w, y, edge_w, 1, edge_col)
+            pyxel.rect(center_x + road_width, y, edge_w, 1, edge_col)
+            pyxel.rect(center_x - 1, y, 2, 1, line_col)
 
     def draw_game_scene(self):
-        # パレットのリセットと夜間モードの適用
-        pyxel.pal()
-        if self.is_night_mode:
-            pyxel.pal(7, 13)
-            pyxel.pal(6, 16)
-            pyxel.pal(11, 3)
-            pyxel.pal(10, 9)
-            pyxel.pal(13, 1)
-            pyxel.pal(34, 21)
-            pyxel.pal(229, 5)
-            pyxel.pal(194, 13)
-            
+        sim = self.sim
+        # 自車の横位置と走行距離は、1ステップ前と今の間を補間した値で描く
+        alpha = self.alpha
+        self.view_car_x = sim.prev_car_x + (sim.car_x - sim.prev_car_x) * alpha
+        self.view_speed = sim.prev_speed + (sim.speed - sim.prev_speed) * alpha
+        # 夜間モードの適用（描画の前に draw で pal() はリセット済み）
+        palette = self.palette
+        night = self.is_night_mode
+        scene_profile = palette.profile(night)
+        palette.apply(scene_profile)
+
         # 背景（空）の描画
         sky_color = 16 if self.is_night_mode else 6
         pyxel.rect(0, 0, pyxel.width, 60, sky_color)
 
         # 雲の描画
-        for c in sorted(self.clouds, key=lambda x: x["depth"]):
-            scale = 0.5 + (c["depth"] * 0.5)
-            pyxel.blt(c["x"] - (c["orig_w"]*scale)/2, c["y"], 1, c["u"], c["v"], c["orig_w"], c["orig_h"], 0)
+        for c in self.clouds:
+            scale = 0.5 + (c.depth * 0.5)
+            pyxel.blt(c.x - (c.orig_w*scale)/2, c.y, 1, c.u, c.v, c.orig_w, c.orig_h, 0)
 
         horizon = 60
         
-        # --- 1. 描画対象をすべて収集してソートする準備 ---
+        # --- 1. 描画対象を奥行き(p)のバケツに登録 ---
+        prof = self.profiler
+        prof.begin("queue")
         # p は 0.0 (地平線) から 1.0 (画面最下部) までの遠近係数
-        render_queue = []
+        render_queue = self.render_queue
+        render_queue.clear()
 
         # 道路オブジェクト（木・看板）の登録
-        current_tree_span = 120.0
-        for obj in self.road_objects:
-            rel_depth = (obj["depth"] - self.speed) % current_tree_span
+        # 前方の見える範囲だけを持つリングバッファなので、奥から順にそのまま登録できる
+        view_depth = (pyxel.height - horizon) / 10  # これより奥は地平線の向こう
+        for obj in sim.roadside.far_to_near():
+            rel_depth = obj.depth - self.view_speed
+            if rel_depth >= view_depth:
+                continue
             # 奥行きを画面上のy座標から逆算してp値を算出
             obj_y_screen = pyxel.height - (rel_depth * 10)
             p = (obj_y_screen - horizon) / (pyxel.height - horizon)
-            if 0 < p < 1.2: # 少し手前まで許容
-                render_queue.append({'type': 'obj', 'p': p, 'data': obj, 'y': obj_y_screen})
+            render_queue.add(KIND_OBJECT, p, obj, obj_y_screen)
 
-        # ライバル車の登録
-        max_view_distance = 500.0
-        for rival in self.rival_cars:
-            if 0 < rival["depth"] < max_view_distance:
-                raw_p = 1.0 - (rival["depth"] / max_view_distance)
-                p = math.pow(raw_p, 1.5) * 0.9 + 0.1
-                render_queue.append({'type': 'rival', 'p': p, 'data': rival})
+        # ライバル車の登録（見えている車の p はまとめて計算済み。data は車の番号）
+        traffic = sim.traffic
+        rival_index, rival_p = traffic.perspective(alpha)
+        for i, p in zip(rival_index.tolist(), rival_p.tolist()):
+            render_queue.add(KIND_RIVAL, p, i)
 
         # 自車の登録 (固定の奥行き p=0.85 付近に配置)
-        render_queue.append({'type': 'player', 'p': 0.85})
-
-        # 奥行き(p)が小さい順（遠い順）にソート
-        render_queue.sort(key=lambda x: x['p'])
+        render_queue.add(KIND_PLAYER, 0.85)
+        prof.end("queue")
 
         # --- 2. 道路（地面）の描画 ---
-        for y in range(horizon, pyxel.height):
-            perspective = (y - horizon) / (pyxel.height - horizon)
-            if perspective <= 0: continue
-            
-            seg = (1 / perspective) + (self.speed * 2)
-            is_white_seg = (int(seg) % 2 == 0)
-            
-            current_grass_col = 34
-            current_road_col = 13
-            current_line_col = 7 if is_white_seg else 13
-            current_edge_col = 7 if is_white_seg else 8
-
-            if self.is_night_mode:
-                if perspective < 0.3:
-                    current_grass_col, current_road_col, current_line_col, current_edge_col = 21, 1, 13, 6
-                elif perspective < 0.5:
-                    current_grass_col, current_road_col, current_line_col = 21, 1, 13
-                    current_edge_col = 13 if is_white_seg else 2
-
-            curve_offset = self.curve_val * (1 - perspective)**3 * 80
-            road_width = 10 + (perspective * 100) * 1.5
-            center_x = (pyxel.width / 2) + curve_offset - (self.car_x * perspective)
-            edge_w = 5 * perspective + 3
-
-            # 地面・道路のライン描画
-            if self.is_night_mode and perspective < 0.3:
-                pyxel.rect(0, y, pyxel.width, 1, 22)
-            else:
-                pyxel.rect(0, y, pyxel.width, 1, current_grass_col)
-            
-            pyxel.rect(center_x - road_width, y, road_width * 2, 1, current_road_col)
-            pyxel.rect(center_x - road_width - edge_w, y, edge_w, 1, current_edge_col)
-            pyxel.rect(center_x + road_width, y, edge_w, 1, current_edge_col)
-            pyxel.rect(center_x - 1, y, 2, 1, current_line_col)
+        # 行ごとの定数は事前計算済み。ここではカーブ・自車位置・走行距離だけを反映する
+        prof.begin("road")
+        raster = self.get_road_raster(horizon) if self.use_road_raster else None
+        if raster:
+            raster.render(sim.curve_val, self.view_car_x, self.view_speed, self.is_night_mode)
+            pyxel.blt(0, raster.top, raster.image, 0, 0, raster.width, raster.rows)
+        else:
+            self.draw_road_rows(horizon)
+        prof.end("road")
 
-        # --- 3. ソートされたオブジェクト・車の描画 ---
+        # --- 3. 奥から順にオブジェクト・車の描画 ---
+        prof.begin("queue")
         for item in render_queue:
-            p = item['p']
+            p = item.p
             y_draw = horizon + (p * (pyxel.height - horizon))
-            c_off = self.curve_val * math.pow(1 - p, 3) * 80
+            c_off = sim.curve_val * math.pow(1 - p, 3) * 80
             
-            if item['type'] == 'obj':
+            if item.kind == KIND_OBJECT:
                 # 道路オブジェクト描画
-                self.draw_single_object(item['data'], item['y'], horizon)
+                palette.apply(scene_profile)
+                self.draw_single_object(item.data, item.y, horizon)
                 
-            elif item['type'] == 'rival':
+            elif item.kind == KIND_RIVAL:
                 # ライバル車描画
-                rival = item['data']
-                riv_x = (pyxel.width / 2) + c_off - (self.car_x * p) + (rival["offset_x"] * p)
+                i = item.data
+                riv_x = (pyxel.width / 2) + c_off - (self.view_car_x * p) + (traffic.offset_x[i] * p)
                 
                 # 向きの制御
-                if self.curve_val > 0.2: riv_u, riv_w = 50, 26
-                elif self.curve_val < -0.2: riv_u, riv_w = -50, 26
+                if sim.curve_val > 0.2: riv_u, riv_w = 50, 26
+                elif sim.curve_val < -0.2: riv_u, riv_w = -50, 26
                 else: riv_u, riv_w = 49, 0
-                if rival.get("is_blown"): riv_u = random.choice([0, 50, -50])
+                if traffic.blown_timer[i] > 0: riv_u = self.fx_random.choice([0, 50, -50])
 
-                pyxel.pal(195, rival["col"])
+                col = int(traffic.col[i])
                 draw_scale = p * 1.5
-                pyxel.blt(riv_x - (abs(riv_w) * draw_scale) / 2, y_draw - (24 * draw_scale), 
-                          0, 0, riv_w, riv_u, 24, 229, 0, draw_scale)
-                pyxel.pal()
-                
-                # 衝突判定（自車のp値付近のみ）
-                if 0.70 < p < 0.95:
-                    if not rival["is_blown"] and abs(riv_x - pyxel.width/2) < 20:
-                        if not self.is_spinning:
-                            self.velocity *= 0.5
-                            self.is_spinning = True
-                            self.is_kanban = True
-                            self.spin_timer = 0
-                            self.shake_amount = 10
-                            rival["is_blown"] = True
-                            rival["speed_kmh"] = 270
-                            rival["blown_timer"] = 10
-
-            elif item['type'] == 'player':
+                x, y = riv_x - (abs(riv_w) * draw_scale) / 2, y_draw - (24 * draw_scale)
+                atlas = self.car_atlas if self.use_car_atlas else None
+                drawn = False
+                if atlas:
+                    # 拡大縮小した絵の中心は等倍で置いたときの中心と同じ。夜の色も焼いてあるので pal() は戻して描く
+                    palette.apply(palette.profile(False))
+                    drawn = riv_u == 0 or atlas.draw(x + abs(riv_u) / 2, y + 12, col, night, riv_w, riv_u, draw_scale)
+                if not drawn:
+                    # 色が前の車と同じなら pal() は呼ばれない
+                    palette.apply(palette.profile(night, col))
+                    pyxel.blt(x, y, 0, 0, riv_w, riv_u, 24, 229, 0, draw_scale)
+
+            elif item.kind == KIND_PLAYER:
                 # 自車のライト（夜間のみ）
-                if self.is_night_mode:
+                if night:
+                    palette.apply(palette.profile(True)) # ライトも夜の色で描く
                     light_center_x, light_y_base = pyxel.width / 2, 110
-                    swing = -15 if pyxel.btn(pyxel.KEY_LEFT) else 15 if pyxel.btn(pyxel.KEY_RIGHT) else 0
+                    swing = -15 if sim.inputs & INPUT_LEFT else 15 if sim.inputs & INPUT_RIGHT else 0
                     for i in range(1, 9):
                         w = i * 4
                         target_x = light_center_x + (swing * (i / 10))
@@ -887,60 +776,57 @@ class App:
                         if i < 5: pyxel.line(target_x - w//2, ly, target_x + w//2, ly, 7)
 
                 # 自車本体の描画
-                pyxel.pal(195, self.car_color)
+                palette.apply(palette.profile(night, self.car_color))
                 # 自車の座標は 95 で固定（リストのソート順により前後が決定される）
-                pyxel.blt(pyxel.width/2 - 25, 95, 0, 0, self.w, self.u, 24, 229)
-                if self.is_braking:
+                pyxel.blt(pyxel.width/2 - 25, 95, 0, 0, sim.w, sim.u, 24, 229)
+                if sim.is_braking:
                     pyxel.rect(pyxel.width/2 - 14, 110, 5, 2, 8)
                     pyxel.rect(pyxel.width/2 + 9, 110, 5, 2, 8)
-                pyxel.pal()
+        # 風の粒子と UI は昼の色のまま描く
+        palette.apply(palette.profile(False))
+        prof.end("queue")
 
         # エフェクト（風の粒子）
-        for p_item in self.wind_particles:
-            dx, dy = p_item["x"] - pyxel.width / 2, p_item["y"] - 40
-            if dx*dx + dy*dy > 4900:
-                pyxel.line(p_item["x"], p_item["y"], p_item["x"] - p_item["vx"] * 1.2, p_item["y"] - p_item["vy"] * 1.2, p_item["col"])
+        wind = self.wind_particles
+        n = wind.count
+        dx, dy = wind.x[:n] - pyxel.width / 2, wind.y[:n] - 40
+        visible = np.flatnonzero(dx*dx + dy*dy > 4900)
+        x, y = wind.x[visible], wind.y[visible]
+        tail_x, tail_y = x - wind.vx[visible] * 1.2, y - wind.vy[visible] * 1.2
+        for x1, y1, x2, y2, col in zip(x.tolist(), y.tolist(), tail_x.tolist(), tail_y.tolist(), wind.col[visible].tolist()):
+            pyxel.line(x1, y1, x2, y2, col)
 
         # スタートシグナル
-        if self.start_timer > 0:
+        prof.begin("ui")
+        if sim.start_timer > 0:
             cx, cy = pyxel.width / 2, 40
             pyxel.rectb(cx - 25, cy - 10, 50, 20, 7)
             pyxel.rect(cx - 24, cy - 9, 48, 18, 0)
-            col_l = 11 if 0 <= self.start_timer <= 10 else 8 if 10 < self.start_timer < 100 else 5
-            col_m = 8 if 10 < self.start_timer < 70 else 11 if 0 <= self.start_timer <= 10 else 5
-            col_r = 11 if 0 <= self.start_timer <= 10 else 8 if 10 < self.start_timer < 40 else 5
-            pyxel.sounds[1].volumes[0] = 7
-            if self.start_timer == 100:
-                pyxel.play(1, 1)
-            elif self.start_timer == 70:
-                pyxel.play(1, 1)
-            elif self.start_timer == 40:
-                pyxel.play(1, 1)
-            elif self.start_timer == 10:
-                pyxel.sounds[1].notes[0] = 48
-                pyxel.play(1, 1)
+            col_l = 11 if 0 <= sim.start_timer <= 10 else 8 if 10 < sim.start_timer < 100 else 5
+            col_m = 8 if 10 < sim.start_timer < 70 else 11 if 0 <= sim.start_timer <= 10 else 5
+            col_r = 11 if 0 <= sim.start_timer <= 10 else 8 if 10 < sim.start_timer < 40 else 5
             pyxel.circ(cx - 15, cy, 6, col_l)
             pyxel.circ(cx, cy, 6, col_m)
             pyxel.circ(cx + 15, cy, 6, col_r)
-        if self.rocket_text_timer > 0:
+        if sim.rocket_text_timer > 0:
             pyxel.text(pyxel.width/2 - 35, 80, "ROCKET START!!", pyxel.frame_count % 16)
-            self.rocket_text_timer -= 1
-            if self.rocket_text_timer == 0:
-                self.is_rocket_start = False
-        if self.stall_timer > 0:
+        if sim.stall_timer > 0:
             pyxel.text(pyxel.width/2 - 30, 80, "ENGINE STALL!", 8)
-            self.stall_timer -= 1
-            if self.stall_timer == 0:
-                self.is_stalled = False
 
 
         # UIの描画
-        if not self.is_goal:
+        if not sim.is_goal:
+            prof.end("ui")
+            prof.begin("gauge")
             self.draw_speedometer()
-            current_time = max(0, self.frame_count / 30)
+            prof.end("gauge")
+            prof.begin("ui")
+            current_time = max(0, sim.frame_count / 30)
             ui_col = 10 if self.is_night_mode else 0
             pyxel.text(10, 20, f"TIME: {current_time:.2f}s", ui_col)
-            pyxel.text(10, 10, f"DISTANCE: {self.odometer:05.2f}/{self.goal_distance}km", ui_col)
+            pyxel.text(10, 10, f"DISTANCE: {sim.odometer:05.2f}/{sim.goal_distance}km", ui_col)
+            if self.playback and (pyxel.frame_count // 15) % 2 == 0:
+                pyxel.text(10, 30, "REPLAY", 8)
         else:
             s = "CONGRATULATIONS! GOAL!!"
             x_txt = pyxel.width / 2 - len(s) * 2
@@ -948,68 +834,39 @@ class App:
             pyxel.text(x_txt, pyxel.height / 2 - 30, s, 10)
             if self.is_new_record:
                 if (pyxel.frame_count % 20) < 10:
-                    pyxel.text(x_txt + 7, pyxel.height / 2 - 15, f"NEW RECORD: {self.goal_time:.2f} SEC", 7)
+                    pyxel.text(x_txt + 7, pyxel.height / 2 - 15, f"NEW RECORD: {sim.goal_time:.2f} SEC", 7)
                 else:
-                    pyxel.text(x_txt + 7, pyxel.height / 2 - 15, f"NEW RECORD: {self.goal_time:.2f} SEC", 10)
+                    pyxel.text(x_txt + 7, pyxel.height / 2 - 15, f"NEW RECORD: {sim.goal_time:.2f} SEC", 10)
             else:
-                pyxel.text(x_txt + 7, pyxel.height / 2 - 15, f"GOAL TIME: {self.goal_time:.2f} SEC", 10)
+                pyxel.text(x_txt + 7, pyxel.height / 2 - 15, f"GOAL TIME: {sim.goal_time:.2f} SEC", 10)
+            if self.goal_rank is not None:
+                pyxel.text(x_txt + 7, pyxel.height / 2 - 7, f"RANK: {self.goal_rank + 1} / {TOP_N}", 11)
             pyxel.text(x_txt + 7, pyxel.height / 2, "PUSH 'R' TO RESTART", 6)
 
         # リスポーン画面
-        if self.is_respawning:
+        if sim.is_respawning:
             pyxel.cls(0)
             pyxel.text(pyxel.width/2 - 30, pyxel.height/2, "RECOVERING...", 7)
+        prof.end("ui")
     def draw_speedometer(self):
+        sim = self.sim
         mx, my = 170, 130  # メーターの中心位置
         r = 20             # 半径
         
-        # --- 1. RPMメーター（背景を完全に塗りつぶす） ---
-        # 隙間を埋めるため、0.1度刻みでループを回し、少し内側(r+2)から塗り始める
-        # rangeではなくwhileを使って細かく刻む
-        deg = 180.0
-        while deg <= 360.0:
-            rad = math.radians(deg)
-            # 内側の境界をr+2、外側をr+11に設定
-            x1 = mx + math.cos(rad) * (r + 2)
-            y1 = my - 1 + math.sin(rad) * (r + 2)
-            x2 = mx + math.cos(rad) * (r + 11)
-            y2 = my - 1 + math.sin(rad) * (r + 11)
-            pyxel.line(x1, y1, x2, y2, 0)
-            deg += 0.1
-        # self.rpm (0.0~1.0) を 0~180度の範囲に変換
-        # これにより、180度(開始点) + 180度 = 最大360度 に固定されます
-        rpm_angle_range = max(0, min(int(self.rpm * 180), 180))
-        
-        for i in range(rpm_angle_range):
-            rad = math.radians(180 + i)
-            # インジケーターの太さを描画
-            for thick in range(4, 10):
-                px = mx + math.cos(rad) * (r + thick)
-                py = my - 1 + math.sin(rad) * (r + thick)
-                # 色の変化（150度/80%以上で赤）
-                col = 8 if i > 150 else (10 if i > 110 else 11)
-                pyxel.pset(px, py, col)
+        # --- 1. RPMメーター・スピードメーターの文字盤（事前に焼き込んだ画像） ---
+        self.rpm_gauge.draw(sim.rpm)
+
         # --- 2. スピードメーター ---
-        # タコメーターとの接続部を綺麗にするため、スピードメーターの外枠(0番)を先に描く
-        pyxel.circ(mx, my, r + 2, 0)
-        pyxel.circ(mx, my, r, 5)
-        
-        # 目盛り
-        for a in range(135, 406, 45):
-            rad = math.radians(a)
-            pyxel.line(mx + math.cos(rad)*(r-3), my + math.sin(rad)*(r-3), 
-                       mx + math.cos(rad)*r, my + math.sin(rad)*r, 7)
-            
         # 針
-        angle = 135 + (self.velocity / 0.6) * 270
+        angle = 135 + (sim.velocity / 0.6) * 270
         rad = math.radians(angle)
         pyxel.line(mx, my, mx + math.cos(rad)*(r-2), my + math.sin(rad)*(r-2), 8)
         
         # 中心点と速度
         pyxel.circ(mx, my, 2, 7)
-        pyxel.text(mx - 15, my + 5, f"{self.kilometer:3}km/h", 7)
+        pyxel.text(mx - 15, my + 5, f"{sim.kilometer:3}km/h", 7)
 
-        is_redzone = self.rpm > 0.85
+        is_redzone = sim.rpm > 0.85
         
         # 点滅ロジック: 3フレームごとに表示/非表示を切り替える（激しい点滅）
         # pyxel.frame_count % 6 < 3 とすることで、高速にチカチカする
@@ -1020,26 +877,22 @@ class App:
 
         if show_gear:
             # レッドゾーンなら点灯色は赤(8)、そうでなければ通常色(7 or 10)
-            gear_col = 8 if is_redzone else (10 if self.rpm > 0.7 else 7)
-            pyxel.text(mx - 2, my - 13, f"{self.gear + 1}", gear_col)
+            gear_col = 8 if is_redzone else (10 if sim.rpm > 0.7 else 7)
+            pyxel.text(mx - 2, my - 13, f"{sim.gear + 1}", gear_col)
             
         # レッドゾーン時は「SHIFT UP!」と小さく表示
         if is_redzone and (pyxel.frame_count % 10 < 5):
-            if self.gear != 4:
+            if sim.gear != 4:
                 pyxel.text(mx - 18, my - 22, "SHIFT UP!", 8)
         #ベストタイム表示
         bx, by = 130, 138
-        dist = self.goal_distance
-        best = self.best_times.get(dist)
-        
-        if self.is_night_mode:
-            pyxel.text(bx+25, by - 110, f"BEST({dist}km):", 7)
-        else:
-            pyxel.text(bx+25, by - 110, f"BEST({dist}km):", 0)
-        if best is not None:
-            # 純粋な秒数表示に変更
-            pyxel.text(bx + 35, by - 100, f"{best:.2f}s", 10) 
-        else:
-            pyxel.text(bx + 35, by - 100, "---.--s", 5)
-
-App()
\ No newline at end of file
+        pyxel.text(bx+25, by - 110, self.best_label, 7 if self.is_night_mode else 0)
+        pyxel.text(bx + 35, by - 100, self.best_text, self.best_col)
+
+if __name__ == "__main__":
+    # python main.py [COURSE_FILE] [--fps N]（COURSE_FILE で決まったコースを走る）
+    parser = argparse.ArgumentParser(description="Highway Racer")
+    parser.add_argument("course", nargs="?", help="course file to race on")
+    parser.add_argument("--fps", type=int, default=FPS, help="render rate (the race always runs at 30 steps/s)")
+    args = parser.parse_args()
+    App(course=Course.load(args.course) if args.course else None, fps=args.fps)
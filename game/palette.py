@@ -0,0 +1,57 @@
+import pyxel
+
+CAR_BODY_COLOR = 195  # 車の画像でボディの色として塗り替える色
+CAR_COLORS = [195, 12, 10, 11, 14]  # カスタマイズで選べる色（赤, 青, 黄, 緑, 紫）
+# 夜は全体を暗い色に置き換える
+NIGHT_REMAP = {7: 13, 6: 16, 11: 3, 10: 9, 13: 1, 34: 21, 229: 5, 194: 13}
+STEP = 0x33  # 追加する 6x6x6 色の各成分の刻み
+
+
+def extended_colors(base):
+    # 元のパレットの後ろに 6x6x6 のカラーキューブを足して 230 色にする
+    cube = [(i % 6) * STEP + ((i // 6) % 6) * STEP * 0x100 + ((i // 36) % 6) * STEP * 0x10000
+            for i in range(1, 216)]
+    return (list(base) + cube)[:230]
+
+
+class Palette:
+    """pal() の置き換えを「昼/夜 × 車の色」ごとの表（プロファイル）として先に作っておき、
+    今 pyxel に設定している表との差分だけを pal(a, b) で送る。
+    ライバルを1台描くたびに pal() で全部戻して夜の置き換えをやり直す必要がなくなる"""
+    def __init__(self, car_colors=()):
+        self.profiles = {}
+        for night in (False, True):
+            self.profile(night)
+            for col in car_colors:
+                self.profile(night, col)
+        self.current = {}  # 今 pyxel に設定している置き換え
+
+    def profile(self, night, car_color=None):
+        key = (night, car_color)
+        profile = self.profiles.get(key)
+        if profile is None:
+            profile = dict(NIGHT_REMAP) if night else {}
+            if car_color is not None:
+                profile[CAR_BODY_COLOR] = car_color
+            self.profiles[key] = profile
+        return profile
+
+    def reset(self):
+        pyxel.pal()
+        self.current = {}
+
+    def apply(self, profile):
+        current = self.current
+        if profile is current:
+            return
+        reverts = [col for col in current if col not in profile and current[col] != col]
+        if len(reverts) > len(profile):
+            # 戻す色のほうが多ければ pal() で一度に戻してから置き換え直す
+            self.reset()
+            current, reverts = self.current, []
+        for col, new in profile.items():
+            if current.get(col, col) != new:
+                pyxel.pal(col, new)
+        for col in reverts:
+            pyxel.pal(col, col)
+        self.current = profile
@@ -0,0 +1,59 @@
+import numpy as np
+
+
+class ParticlePool:
+    """固定容量のパーティクル置き場。各値を配列で持ち、先頭 count 個が生きている粒子。
+    満杯のときに追加された分は捨てる（上限を超えて増えない）"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.speed_up = np.ones(capacity)   # 毎フレーム速度に掛ける倍率
+        self.gravity = np.zeros(capacity)   # 毎フレーム vy に足す値
+        self.angle = np.zeros(capacity)
+        self.va = np.zeros(capacity)        # 回転速度
+        self.col = np.zeros(capacity, dtype=np.int64)
+        self.fields = (self.x, self.y, self.vx, self.vy, self.speed_up,
+                       self.gravity, self.angle, self.va, self.col)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, x, y, vx, vy, col, speed_up=1.0, gravity=0.0, angle=0.0, va=0.0):
+        # 引数はスカラーでも配列でもよい（配列なら複数個まとめて追加）
+        values = np.broadcast_arrays(x, y, vx, vy, speed_up, gravity, angle, va, col)
+        n = min(values[0].size, self.capacity - self.count)
+        if n <= 0:
+            return 0
+        start, end = self.count, self.count + n
+        for field, value in zip(self.fields, values):
+            field[start:end] = value.ravel()[:n]
+        self.count = end
+        return n
+
+    def update(self):
+        n = self.count
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.vx[:n] *= self.speed_up[:n]
+        self.vy[:n] *= self.speed_up[:n]
+        self.vy[:n] += self.gravity[:n]
+        self.angle[:n] += self.va[:n]
+
+    def cull(self, x_min=-np.inf, x_max=np.inf, y_min=-np.inf, y_max=np.inf):
+        # 範囲外に出た粒子を消して、生きている粒子を前に詰める
+        n = self.count
+        x, y = self.x[:n], self.y[:n]
+        keep = (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+        alive = np.flatnonzero(keep)
+        if alive.size == n:
+            return
+        for field in self.fields:
+            field[:alive.size] = field[alive]
+        self.count = alive.size
@@ -0,0 +1,57 @@
+import time
+from collections import deque
+
+# 計測する処理（表示順）
+PHASES = ("physics", "rivals", "effects", "road", "queue", "gauge", "ui")
+
+
+class FrameProfiler:
+    """フレーム内の処理ごとの時間を測る。直近 window フレームの p50/p99 と、
+    計測を始めてからの全フレームのヒストグラム (BIN_MS 刻み) を持つ"""
+    BIN_MS = 0.25
+    BIN_COUNT = 160  # 0〜40ms、それ以上は最後のビンにまとめる
+
+    def __init__(self, phases=PHASES, window=120):
+        self.phases = tuple(phases) + ("frame",)
+        self.enabled = False
+        self.frames = 0
+        self.started = {}
+        self.current = dict.fromkeys(self.phases, 0.0)
+        self.history = {name: deque(maxlen=window) for name in self.phases}
+        self.histogram = {name: [0] * (self.BIN_COUNT + 1) for name in self.phases}
+
+    def begin(self, name):
+        if self.enabled:
+            self.started[name] = time.perf_counter()
+
+    def end(self, name):
+        start = self.started.pop(name, None)
+        if start is not None:
+            self.current[name] += time.perf_counter() - start
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        for name in self.phases:
+            ms = self.current[name] * 1000
+            self.current[name] = 0.0
+            self.history[name].append(ms)
+            self.histogram[name][min(int(ms / self.BIN_MS), self.BIN_COUNT)] += 1
+        self.started.clear()
+        self.frames += 1
+
+    def percentile(self, name, q):
+        values = sorted(self.history[name])
+        if not values:
+            return 0.0
+        return values[min(int(len(values) * q), len(values) - 1)]
+
+    def dump(self, path):
+        # 1行 = 1ビン。各列はそのビンに入ったフレーム数
+        with open(path, "w") as f:
+            f.write(f"# frames: {self.frames}\n")
+            f.write("bin_ms," + ",".join(self.phases) + "\n")
+            for i in range(self.BIN_COUNT + 1):
+                counts = [self.histogram[name][i] for name in self.phases]
+                if any(counts):
+                    f.write(f"{i * self.BIN_MS:.2f}," + ",".join(map(str, counts)) + "\n")
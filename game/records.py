@@ -0,0 +1,181 @@
+"""ゴールタイムの記録。
+
+全記録は records.log に1行1件の JSON で追記していく（書き換えないので、書き込み中に
+落ちても壊れるのは最後の1行だけ）。条件ごとのベストと上位の表は records.json に索引として
+まとめ、一時ファイルに書いてから置き換えるので、起動時はこれを読むだけで済む。
+索引が壊れていたり古かったりしたときは records.log から作り直す。
+"""
+import json
+import os
+import time
+from leaderboard import Leaderboard
+
+LOG_FILE = "records.log"
+INDEX_FILE = "records.json"
+LEGACY_FILE = "best_times.json"  # 以前の {距離: ベストタイム} 形式
+DEFAULT_DISTANCES = (1.0, 3.0, 5.0, 10.0)
+
+
+def atomic_write(path, data):
+    # 同じディレクトリの一時ファイルに書き切ってから置き換える（途中で落ちても元のファイルが残る）
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def record_key(distance, is_automatic, night, car):
+    # 条件ごとのベストを区別するキー（例: "5.0|MT|day|195"）
+    return f"{float(distance)}|{'AT' if is_automatic else 'MT'}|{'night' if night else 'day'}|{car}"
+
+
+class RecordStore:
+    """best: 条件（record_key）ごとのベストタイム, distance_best: 距離ごとの条件を問わないベストタイム,
+    leaderboard: 距離・AT/MT・昼夜ごとの上位の表。
+    index_file を None にすると索引を使わず、毎回 records.log を頭から読む。
+    read_only にすると読むだけでファイルには何も書かない（ゲームが書き込み中の行もそのまま残す）"""
+    def __init__(self, log_file=LOG_FILE, index_file=INDEX_FILE, legacy_file=LEGACY_FILE, read_only=False):
+        self.log_file = log_file
+        self.index_file = index_file
+        self.read_only = read_only
+        self.clear()
+        indexed = self.load_index()
+        if not indexed:
+            self.clear()
+        # 索引のあとに追記された分（普通は無い）だけ読む
+        changed = self.read_log()
+        if read_only:
+            return
+        if not os.path.exists(self.log_file) and legacy_file and os.path.exists(legacy_file):
+            self.import_legacy(legacy_file)
+            changed = True
+        if changed or not indexed:
+            self.save_index()
+
+    def clear(self):
+        self.best = {}
+        self.distance_best = {dist: None for dist in DEFAULT_DISTANCES}
+        self.leaderboard = Leaderboard()
+        self.log_size = 0  # 索引に反映済みの records.log のバイト数
+
+    def load_index(self):
+        if not self.index_file or not os.path.exists(self.index_file):
+            return False
+        try:
+            with open(self.index_file, "r") as f:
+                data = json.load(f)
+            self.log_size = data["log_size"]
+            self.best = data["best"]
+            self.distance_best.update({float(k): v for k, v in data["distance_best"].items()})
+            self.leaderboard = Leaderboard(tables=data["top"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Load Error: {e}")  # records.log から作り直す
+            return False
+        if self.log_size > (os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0):
+            return False  # ログのほうが短い（消された・差し替えられた）
+        return True
+
+    def read_log(self):
+        # log_size から後ろの記録を反映して、反映した件数を返す
+        if not os.path.exists(self.log_file):
+            return 0
+        count = 0
+        with open(self.log_file, "rb") as f:
+            f.seek(self.log_size)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 書き込み途中で落ちた最後の行
+                try:
+                    self.apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    print(f"Load Error: broken record at byte {self.log_size}")
+                self.log_size += len(line)
+                count += 1
+        if self.log_size < os.path.getsize(self.log_file) and not self.read_only:
+            # 壊れた最後の行を捨てて、次の追記がそこに続かないようにする
+            with open(self.log_file, "r+b") as f:
+                f.truncate(self.log_size)
+        return count
+
+    def import_legacy(self, legacy_file):
+        # 以前の best_times.json は条件が分からないので、距離ごとのベストとしてだけ引き継ぐ
+        try:
+            with open(legacy_file, "r") as f:
+                data = json.load(f)
+            for dist, goal_time in data.items():
+                if goal_time is not None:
+                    self.add(float(dist), None, None, None, goal_time, save=False)
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Load Error: {e}")
+
+    def apply(self, record):
+        # 記録を索引に反映して、上位の表での順位（0 = 1位、圏外なら None）を返す
+        dist, goal_time = float(record["distance"]), record["time"]
+        if record["automatic"] is not None:
+            key = record_key(dist, record["automatic"], record["night"], record["car"])
+            if key not in self.best or goal_time < self.best[key]:
+                self.best[key] = goal_time
+        best = self.distance_best.get(dist)
+        if best is None or goal_time < best:
+            self.distance_best[dist] = goal_time
+        return self.leaderboard.insert(record)
+
+    def get(self, distance, is_automatic, night, car):
+        return self.best.get(record_key(distance, is_automatic, night, car))
+
+    def add(self, distance, is_automatic, night, car, goal_time, seed=None, course_id=0, save=True):
+        # course_id: コースファイルで走ったときはその id（seed のランダムなコースなら 0）
+        record = {"distance": float(distance), "automatic": is_automatic, "night": night, "car": car,
+                  "time": goal_time, "seed": seed, "course_id": course_id, "date": int(time.time())}
+        line = (json.dumps(record) + "\n").encode()
+        # ログに書けてから反映する（書けなかった記録はメモリにも索引にも入れない）
+        size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        try:
+            with open(self.log_file, "ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print(f"Save Error: {e}")
+            try:
+                # 途中まで書けた行は次の記録とつながらないように切り捨てる
+                with open(self.log_file, "r+b") as f:
+                    f.truncate(size)
+            except OSError:
+                pass
+            return None
+        rank = self.apply(record)
+        self.log_size += len(line)
+        if save:
+            self.save_index()
+        return rank
+
+    def save_index(self):
+        if not self.index_file:
+            return
+        data = {"log_size": self.log_size, "best": self.best,
+                "distance_best": {str(k): v for k, v in self.distance_best.items()},
+                "top": self.leaderboard.tables}
+        try:
+            atomic_write(self.index_file, json.dumps(data).encode())
+        except OSError as e:
+            print(f"Save Error: {e}")
+
+    def history(self, distance=None):
+        # 全記録を古い順に（ログを頭から読むので、一覧を見るときだけ使う）
+        records = []
+        if os.path.exists(self.log_file):
+            with open(self.log_file, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if distance is None or record["distance"] == float(distance):
+                        records.append(record)
+        return records
@@ -0,0 +1,48 @@
+KIND_OBJECT = 0  # 木・看板
+KIND_RIVAL = 1
+KIND_PLAYER = 2
+
+
+class RenderItem:
+    __slots__ = ("kind", "p", "data", "y")
+
+
+class RenderQueue:
+    """遠近係数 p (0.0 = 地平線, 1.0 = 画面最下部) ごとのバケツに描画対象を入れ、
+    奥から順に取り出す。バケツと要素は使い回すので毎フレームのソートや dict の生成はない"""
+    def __init__(self, bucket_count=120, p_max=1.2):
+        self.buckets = [[] for _ in range(bucket_count)]
+        self.scale = bucket_count / p_max
+        self.items = []  # 使い回す RenderItem
+        self.size = 0
+        self.used = []   # 中身が入っているバケツ
+
+    def clear(self):
+        for i in self.used:
+            self.buckets[i].clear()
+        self.used.clear()
+        self.size = 0
+
+    def add(self, kind, p, data=None, y=0):
+        if self.size == len(self.items):
+            self.items.append(RenderItem())
+        item = self.items[self.size]
+        self.size += 1
+        item.kind, item.p, item.data, item.y = kind, p, data, y
+
+        i = min(max(int(p * self.scale), 0), len(self.buckets) - 1)
+        bucket = self.buckets[i]
+        if not bucket:
+            self.used.append(i)
+        bucket.append(item)
+        # 同じバケツ内だけは p の順に並べる（ほとんどの場合は末尾に追加するだけ）
+        j = len(bucket) - 1
+        while j > 0 and bucket[j - 1].p > p:
+            bucket[j] = bucket[j - 1]
+            j -= 1
+        bucket[j] = item
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            if bucket:
+                yield from bucket
@@ -0,0 +1,161 @@
+import os
+import struct
+import sys
+import time
+from simulation import Simulation, FPS
+from course import Course
+from records import RecordStore, atomic_write
+
+# ヘッダ: マジック, バージョン, seed, ゴール距離, AT/MT, 木・看板の密度, フレーム数,
+#         ライバル車の上限台数, スポーン間隔, 車線の数, コースID（コースファイルを使わないときは 0）
+HEADER = struct.Struct("<4sBIdBdIHHBI")
+MAGIC = b"HRRP"
+VERSION = 4  # ライバル車の動きが変わると同じ入力でも結果が変わるので上げる
+REPLAY_DIR = "replays"
+
+
+def replay_path(key, directory=REPLAY_DIR):
+    # key は records.record_key（例: "5.0|MT|day|195" → best_5.0_MT_day_195.hrr）
+    return os.path.join(directory, f"best_{key.replace('|', '_')}.hrr")
+
+
+class Recorder:
+    """レース開始時の設定と、毎フレームの入力ビットマスクを記録する"""
+    def __init__(self, sim):
+        self.seed = sim.seed
+        self.goal_distance = sim.goal_distance
+        self.is_automatic = sim.is_automatic
+        self.roadside_density = sim.roadside_density
+        traffic = sim.traffic
+        self.rival_settings = (traffic.limit, traffic.interval, traffic.lanes)
+        self.course_id = sim.course.course_id if sim.course else 0
+        self.inputs = bytearray()
+
+    def record(self, inputs):
+        self.inputs.append(inputs)
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, VERSION, self.seed, self.goal_distance,
+                             self.is_automatic, self.roadside_density, len(self.inputs),
+                             *self.rival_settings, self.course_id)
+        # 同じ入力が続く区間を (入力, 長さ) の2バイトにまとめる
+        body = bytearray()
+        i, n = 0, len(self.inputs)
+        while i < n:
+            value, run = self.inputs[i], 1
+            while run < 255 and i + run < n and self.inputs[i + run] == value:
+                run += 1
+            body += bytes((value, run))
+            i += run
+        return header + bytes(body)
+
+    def save(self, path):
+        atomic_write(path, self.to_bytes())
+
+
+class Replay:
+    def __init__(self, data):
+        if len(data) < HEADER.size or data[:4] != MAGIC:
+            raise ValueError("not a replay file")
+        (magic, version, seed, goal_distance, is_automatic, density, frames,
+         rival_limit, rival_interval, rival_lanes, course_id) = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError(f"unsupported replay version {version}")
+        self.seed = seed
+        self.goal_distance = goal_distance
+        self.is_automatic = bool(is_automatic)
+        self.roadside_density = density
+        self.rival_settings = (rival_limit, rival_interval, rival_lanes)
+        self.course_id = course_id
+        self.inputs = bytearray()
+        body = data[HEADER.size:]
+        # (入力, 回数) の組が欠けていたり、回数の合計がフレーム数と合わなければ壊れている
+        if len(body) % 2 != 0 or sum(body[1::2]) != frames:
+            raise ValueError("broken replay file")
+        for k in range(0, len(body), 2):
+            self.inputs += bytes((body[k],)) * body[k + 1]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def make_simulation(self, course=None):
+        # コースファイルで走った記録は、同じコースファイルがないと再生できない
+        if not self.matches(course):
+            raise ValueError("replay was recorded on a different course")
+        rival_limit, rival_interval, rival_lanes = self.rival_settings
+        return Simulation(self.goal_distance, self.is_automatic,
+                          roadside_density=self.roadside_density, seed=self.seed,
+                          rival_limit=rival_limit, rival_interval=rival_interval, rival_lanes=rival_lanes,
+                          course=course)
+
+    def matches(self, course):
+        return self.course_id == (course.course_id if course else 0)
+
+    def input_at(self, frame):
+        # 記録が尽きたら何も押していない扱い
+        return self.inputs[frame] if frame < len(self.inputs) else 0
+
+    def run(self, course=None):
+        """描画なしで最後まで再生し、終了時点のシミュレーションを返す"""
+        sim = self.make_simulation(course)
+        for inputs in self.inputs:
+            sim.step(inputs)
+            if sim.is_goal:
+                break
+        return sim
+
+
+def verify(log_file, directory=REPLAY_DIR, course=None):
+    # 条件ごとのベストタイムを、保存されたリプレイを再生して確かめる
+    records = RecordStore(log_file, index_file=None, legacy_file=None, read_only=True)  # 索引を使わずログから数え直す
+    ok = True
+    for key, best in sorted(records.best.items()):
+        path = replay_path(key, directory)
+        if not os.path.exists(path):
+            print(f"{key}: {best:.2f}s  NO REPLAY")
+            ok = False
+            continue
+        replay = Replay.load(path)
+        if not replay.matches(course):
+            # コースファイルで走った記録はそのコースを渡さないと再生できない
+            reason = "NEEDS COURSE" if course is None else "WRONG COURSE"
+            print(f"{key}: {best:.2f}s  {reason} (course id {replay.course_id:08x})")
+            ok = False
+            continue
+        sim = replay.run(course)
+        valid = sim.is_goal and abs(sim.goal_time - best) < 1 / FPS / 2
+        result = f"{sim.goal_time:.2f}s" if sim.is_goal else "DID NOT FINISH"
+        print(f"{key}: {best:.2f}s  replay {result}  {'OK' if valid else 'MISMATCH'}")
+        ok = ok and valid
+    return ok
+
+
+def main(argv):
+    if len(argv) in (3, 4) and argv[0] == "--verify":
+        course = Course.load(argv[3]) if len(argv) == 4 else None
+        return 0 if verify(argv[1], argv[2], course) else 1
+    if len(argv) not in (1, 2):
+        print("usage: python replay.py REPLAY_FILE [COURSE_FILE]")
+        print("       python replay.py --verify RECORDS_LOG REPLAY_DIR [COURSE_FILE]")
+        return 2
+    replay = Replay.load(argv[0])
+    course = Course.load(argv[1]) if len(argv) == 2 else None
+    if not replay.matches(course):
+        print("this replay was recorded on a different course; pass its course file")
+        return 1
+    start = time.perf_counter()
+    sim = replay.run(course)
+    elapsed = time.perf_counter() - start
+    frames = sim.tick
+    if sim.is_goal:
+        print(f"goal time: {sim.goal_time:.2f}s ({replay.goal_distance}km)")
+    else:
+        print(f"did not finish: {sim.odometer:.2f}/{replay.goal_distance}km")
+    print(f"{frames} frames in {elapsed:.3f}s ({frames / FPS / max(elapsed, 1e-9):.0f}x real time)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
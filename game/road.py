@@ -0,0 +1,93 @@
+import numpy as np
+
+# 昼の配色 (芝生, 道路, センターライン白/黒, 縁石 白/赤)
+DAY_COLORS = (34, 13, 7, 13, 7, 8)
+# 夜の配色（遠くほど暗い）
+NIGHT_FAR_COLORS = (22, 1, 13, 13, 6, 6)    # perspective < 0.3
+NIGHT_MID_COLORS = (21, 1, 13, 13, 13, 2)   # perspective < 0.5
+
+
+class RoadProjection:
+    """道路の各スキャンライン（地平線〜画面下端）で毎フレーム変わらない値の表。
+    画面サイズが変わったときだけ作り直す"""
+    def __init__(self, width, height, horizon=60):
+        self.width = width
+        self.height = height
+        self.horizon = horizon
+        # 1行 = (y, perspective, 1/perspective, カーブ係数, 道路の半幅, 縁石幅, 昼の色, 夜の色)
+        self.rows = []
+        for y in range(horizon, height):
+            perspective = (y - horizon) / (height - horizon)
+            if perspective <= 0: continue
+            if perspective < 0.3:
+                night_colors = NIGHT_FAR_COLORS
+            elif perspective < 0.5:
+                night_colors = NIGHT_MID_COLORS
+            else:
+                night_colors = DAY_COLORS
+            self.rows.append((
+                y,
+                perspective,
+                1 / perspective,
+                (1 - perspective)**3 * 80,
+                10 + (perspective * 100) * 1.5,
+                5 * perspective + 3,
+                DAY_COLORS,
+                night_colors,
+            ))
+        # RoadRaster 用に同じ値を列ごとの配列でも持つ
+        columns = list(zip(*self.rows))
+        self.ys = np.array(columns[0])
+        self.perspective = np.array(columns[1])
+        self.inv_perspective = np.array(columns[2])
+        self.curve_k = np.array(columns[3])
+        self.road_width = np.array(columns[4])
+        self.edge_w = np.array(columns[5])
+        self.day_colors = np.array(columns[6], dtype=np.uint8)
+        self.night_colors = np.array(columns[7], dtype=np.uint8)
+
+    def matches(self, width, height, horizon):
+        return self.width == width and self.height == height and self.horizon == horizon
+
+
+class RoadRaster:
+    """全スキャンラインの塗り分けを NumPy でまとめて計算して image の画素に直接書き込む。
+    描画側は image を1回 blt するだけでよい（1行ずつ rect を5回呼ぶ代わり）"""
+    def __init__(self, projection, image):
+        self.projection = projection
+        self.image = image
+        self.top = int(projection.ys[0])
+        self.width = projection.width
+        self.rows = len(projection.ys)
+        # pyxel.Image の画素メモリをそのまま1次元の配列として扱う
+        self.pixels = np.ctypeslib.as_array(image.data_ptr(), shape=(self.rows * self.width,))
+        self.bounds = np.empty((self.rows, 8))
+        self.run_colors = np.empty((self.rows, 7), dtype=np.uint8)
+
+    def render(self, curve_val, car_x, speed, night):
+        proj = self.projection
+        colors = proj.night_colors if night else proj.day_colors
+        white = (proj.inv_perspective + speed * 2).astype(np.int64) % 2 == 0
+        center = self.width / 2 + curve_val * proj.curve_k - car_x * proj.perspective
+
+        # 1行は左から 芝生|縁石|道路|センターライン|道路|縁石|芝生 の7区間。
+        # 区間の境目を画面内に収めて、色ごとの長さとして並べる
+        bounds = self.bounds
+        bounds[:, 0] = 0
+        bounds[:, 2] = center - proj.road_width
+        bounds[:, 1] = bounds[:, 2] - proj.edge_w
+        bounds[:, 3] = center - 1
+        bounds[:, 4] = center + 1
+        bounds[:, 5] = center + proj.road_width
+        bounds[:, 6] = bounds[:, 5] + proj.edge_w
+        bounds[:, 7] = self.width
+        np.floor(bounds, out=bounds)
+        np.clip(bounds, 0, self.width, out=bounds)
+        lengths = np.diff(bounds, axis=1).astype(np.int64)
+
+        run_colors = self.run_colors
+        run_colors[:, 0] = run_colors[:, 6] = colors[:, 0]
+        run_colors[:, 1] = run_colors[:, 5] = np.where(white, colors[:, 4], colors[:, 5])
+        run_colors[:, 2] = run_colors[:, 4] = colors[:, 1]
+        run_colors[:, 3] = np.where(white, colors[:, 2], colors[:, 3])
+        self.pixels[:] = np.repeat(run_colors.ravel(), lengths.ravel())
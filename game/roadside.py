@@ -0,0 +1,100 @@
+import math
+import random
+
+
+class RoadObject:
+    """木・看板1つ分。後ろに抜けたら RoadsideStream が前方に置き直して使い回す"""
+    __slots__ = ("depth", "margin_x", "size", "type", "color")
+
+
+class RoadsideStream:
+    """自車から前方 view_ahead までの木・看板だけを奥行き順に持つリングバッファ。
+    speed が進むと後ろに抜けたものを前方に回して使い回すので、
+    コースが長くても密度を上げても持つ数は「見える範囲 × 密度」で一定。
+    density が 0 以下なら何も置かない"""
+    def __init__(self, density=1 / 3, view_ahead=12.0, rng=None):
+        self.rng = rng or random.Random()
+        density = max(density, 0)
+        self.spacing = 1 / density if density else math.inf  # 奥行き 1 あたり density 個
+        self.view_ahead = view_ahead
+        self.slots = [None] * (int(view_ahead * density) + 2)
+        self.head = 0
+        self.count = 0
+        self.spare = []  # 後ろに抜けて再利用を待つオブジェクト
+        self.next_depth = 0.0 if density else math.inf  # 次に置く奥行き（置かないなら無限遠）
+        self.advance(0)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, k):
+        # k = 0 が一番手前
+        return self.slots[(self.head + k) % len(self.slots)]
+
+    def far_to_near(self):
+        slots, head, size = self.slots, self.head, len(self.slots)
+        for k in range(self.count - 1, -1, -1):
+            yield slots[(head + k) % size]
+
+    def index_at(self, depth):
+        # 奥行きが depth 以上で一番手前のものの番号（奥行き順に並んでいるので二分探索）
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid].depth < depth:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def between(self, near, far):
+        # 奥行きが near 以上 far 未満のものを奥から順に
+        start, end = self.index_at(near), self.index_at(far)
+        for k in range(end - 1, start - 1, -1):
+            yield self[k]
+
+    def drop_passed(self, speed):
+        # 自車より後ろに抜けたものを外す
+        slots = self.slots
+        while self.count and slots[self.head].depth < speed:
+            self.spare.append(slots[self.head])
+            slots[self.head] = None
+            self.head = (self.head + 1) % len(slots)
+            self.count -= 1
+
+    def advance(self, speed):
+        self.drop_passed(speed)
+        # 一気に進んだ場合は見える範囲まで飛ばす
+        if self.next_depth < speed:
+            skipped = int((speed - self.next_depth) / self.spacing)
+            self.next_depth += skipped * self.spacing
+        # 前方の見える範囲まで補充
+        while self.next_depth < speed + self.view_ahead:
+            obj = self.spare.pop() if self.spare else RoadObject()
+            self.place(obj, self.next_depth)
+            self.push(obj)
+            self.next_depth += self.spacing
+
+    def push(self, obj):
+        if self.count == len(self.slots):
+            # 満杯なら順番を保ったまま広げる
+            self.slots = [self[k] for k in range(self.count)] + [None] * self.count
+            self.head = 0
+        self.slots[(self.head + self.count) % len(self.slots)] = obj
+        self.count += 1
+
+    def place(self, obj, depth):
+        rng = self.rng
+        obj_type = "tree" if rng.random() > 0.2 else "sign"
+        side = rng.choice([-2.25, 2.25])
+        if obj_type == "sign":
+            # 縁石のすぐ隣（マージン 5〜10）
+            margin = rng.uniform(5, 10)
+        else:
+            # 木は少し離れた場所（マージン 20〜50）
+            margin = rng.uniform(20, 50)
+        obj.depth = depth
+        obj.margin_x = margin * side
+        obj.size = rng.uniform(1.0, 1.3)
+        obj.type = obj_type
+        obj.color = rng.choice([10, 12, 14])
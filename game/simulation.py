@@ -0,0 +1,383 @@
+import math
+import random
+from roadside import RoadsideStream
+from traffic import TrafficPool
+from track import TrackStream
+from course import CourseTrack, CourseRoadside
+
+# 1フレーム分の入力（キーの押下状態）をまとめたビットマスク
+INPUT_UP = 1 << 0         # アクセル
+INPUT_DOWN = 1 << 1       # ブレーキ
+INPUT_LEFT = 1 << 2
+INPUT_RIGHT = 1 << 3
+INPUT_GEAR_UP = 1 << 4    # E
+INPUT_GEAR_DOWN = 1 << 5  # Q
+INPUT_NITRO = 1 << 6      # SPACE
+
+FPS = 30
+# 衝突判定で使う画面の寸法（描画側の pyxel.width / pyxel.height / 地平線と同じ値）
+SCREEN_W = 200
+SCREEN_H = 150
+HORIZON = 60
+
+
+class Simulation:
+    """pyxel に依存しないレースの物理部分。step() を呼ぶたびに 1 フレーム進む"""
+    GEAR_SETTINGS = [
+                {"accel": 1.0,  "max_vel": 0.15},
+                {"accel": 0.7,  "max_vel": 0.30},
+                {"accel": 0.5,  "max_vel": 0.45},
+                {"accel": 0.35, "max_vel": 0.55},
+                {"accel": 0.30,  "max_vel": 0.70},
+            ]
+    SHIFT_POINTS = (0.85, 0.6)  # オートマがシフトアップ・ダウンする回転数
+    ROAD_LIMIT = 165
+    SIGNAL_TICKS = (100, 70, 40, 10)  # スタートのシグナルが変わる（音を鳴らす）start_timer の値
+    HIT_P_RANGE = (0.75, 0.85)  # 木・看板に当たる遠近係数 p の範囲（自車の位置）
+
+    def __init__(self, goal_distance=5.0, is_automatic=False, gear_settings=None,
+                 roadside_density=1 / 3, seed=None, rival_limit=3, rival_interval=90, rival_lanes=0,
+                 course=None, shift_points=None):
+        # 同じ seed なら同じ入力で必ず同じレースになる
+        self.seed = random.randrange(2**32) if seed is None else seed
+        # 用途ごとに乱数列を分け、どれかの消費量が変わっても他がずれないようにする
+        self.roadside_rng = random.Random(f"{self.seed}:roadside")
+        self.rival_rng = random.Random(f"{self.seed}:rival")
+        self.engine_rng = random.Random(f"{self.seed}:engine")  # 空ぶかしの針の震え
+        self.fx_rng = random.Random(f"{self.seed}:fx")          # 芝生の揺れなど見た目だけのもの
+        # コースファイル（Course）を渡すと、ゴール距離・カーブ・木や看板・ライバルはそれに従う
+        self.course = course
+        self.goal_distance = course.goal_distance if course else goal_distance
+        self.is_automatic = is_automatic
+        self.gear_settings = gear_settings or self.GEAR_SETTINGS
+        self.shift_up_rpm, self.shift_down_rpm = shift_points or self.SHIFT_POINTS
+        self.inputs = 0       # 今回のフレームの入力
+        self.prev_inputs = 0  # 前回のフレームの入力（押した瞬間の判定用）
+        self.events = []      # 描画側で鳴らす音などの通知
+        self.profiler = None  # 処理時間の計測用（FrameProfiler）
+        self.tick = 0
+        self.is_respawning = False
+        self.respawn_timer = 0
+        self.gear = 0
+        self.rpm = 0
+        self.display_rpm = 0
+        self.speed = 0
+        self.car_x = 0
+        # 1ステップ前の値（描画でステップの間を補間する用）
+        self.prev_speed = 0
+        self.prev_car_x = 0
+        self.velocity = 0
+        self.kilometer = 0
+        self.u = 49
+        self.w = 50
+        self.total_distance = 0.0
+        self.odometer = 0.0
+        self.is_goal = False
+        self.is_braking = False
+        self.is_kanban = False
+        self.is_out = False
+        self.frame_count = 0
+        self.goal_time = 0
+        self.is_boosting = False      # ブースト中かどうかのフラグ
+        self.boost_timer = 0          # ブーストの残り時間
+        self.boost_cooldown = 0       # 次にブーストできるまでの待ち時間
+        self.is_rocket_start = False
+        self.rocket_timer = 0
+        self.rocket_text_timer = 0
+        self.is_stalled = False
+        self.stall_timer = 0
+        self.track_pos = 0
+        self.curve_val = 0
+        self.target_curve = 0
+        self.is_spinning = False  # スピン中フラグ
+        self.spin_timer = 0       # スピンの経過時間
+        self.shake_amount = 0  # 衝撃による揺れの強さ
+        self.grass_shake = 0   # 芝生による現在の揺れ幅
+        # 木・看板（前方の見える範囲だけを流しながら生成する）
+        self.roadside_density = roadside_density
+        if course:
+            self.roadside = CourseRoadside(course.objects)
+        else:
+            self.roadside = RoadsideStream(roadside_density, rng=self.roadside_rng)
+
+        # ライバル車（NPC）。同時に走る台数・スポーン間隔・車線の数を指定できる
+        self.traffic = TrafficPool(rival_limit, rival_interval, rival_lanes, rng=self.rival_rng)
+        if course:
+            self.traffic.schedule = course.spawns
+        self.start_timer = 200
+        # コースは進むのに合わせて少し先までだけ作る（坂・道幅は指定したときだけ）
+        self.track = CourseTrack(course.curves) if course else TrackStream(self.seed)
+        self.segment = self.track.segment_at(0)  # 今いるセグメント（カーブ・坂・道幅）
+
+    def spawn_rival(self, depth):
+        # 追加した車の番号を返す（満杯なら -1）
+        return self.traffic.spawn(depth)
+
+    def step(self, inputs):
+        """入力ビットマスクを受け取り 1 フレーム進める。発生したイベントのリストを返す"""
+        self.events = []
+        self.prev_inputs, self.inputs = self.inputs, inputs
+        pressed = inputs & ~self.prev_inputs
+        self.tick += 1
+        self.prev_speed, self.prev_car_x = self.speed, self.car_x
+        prof = self.profiler
+        if prof: prof.begin("physics")
+        self.update_player(inputs, pressed)
+        self.roadside.advance(self.speed)
+        if prof: prof.end("physics"); prof.begin("rivals")
+        self.update_rivals()
+        if prof: prof.end("rivals"); prof.begin("physics")
+        # 衝突は全員が動いた後の位置で判定する
+        self.check_roadside_hits()
+        self.check_rival_hits()
+        if prof: prof.end("physics")
+        self.update_timers()
+        return self.events
+
+    def update_player(self, inputs, pressed):
+        # --- RPMの基本計算（走行中または空ぶかし） ---
+        target_rpm = 0
+        if self.start_timer > 0:
+            # カウントダウン中：UPキーで空ぶかし
+            if inputs & INPUT_UP:
+                target_rpm = 0.9 + self.engine_rng.uniform(-0.05, 0.05) # 針を震わせる
+        else:
+            # 走行中：速度とギアに基づく本来のRPM
+            gear_set = self.gear_settings[self.gear]
+            target_rpm = self.velocity / gear_set["max_vel"]
+            # display_rpm を走行用RPMに徐々に近づける
+            self.display_rpm += (target_rpm - self.display_rpm) * 0.1
+        self.display_rpm += (target_rpm - self.display_rpm) * 0.2
+        self.rpm = self.display_rpm
+
+        #オートマチック
+        if self.is_automatic and self.start_timer == 0 and not self.is_goal:
+            if self.rpm > self.shift_up_rpm and self.gear < 4:
+                self.gear += 1
+            elif self.rpm < self.shift_down_rpm and self.gear > 0:
+                self.gear -= 1
+
+        if self.start_timer > 0:
+            self.start_timer -= 1
+            self.velocity = 0
+            if self.start_timer in self.SIGNAL_TICKS:
+                self.events.append("signal")
+            if self.start_timer > 40 and inputs & INPUT_UP:
+                self.is_stalled = True
+            elif not inputs & INPUT_UP:
+                self.is_stalled = False
+            if 10 < self.start_timer < 40 and inputs & INPUT_UP:
+                if not self.is_stalled:
+                    self.is_rocket_start = True
+            elif self.start_timer < 10 and not inputs & INPUT_UP:
+                self.is_rocket_start = False # 離しちゃダメ
+            if self.start_timer == 0:
+                self.frame_count = 0
+                if self.is_stalled:
+                    self.stall_timer = 60 # 2秒間動けない
+                    self.velocity = 0
+                elif self.is_rocket_start:
+                    self.velocity = 0.25
+                    self.rocket_timer = 60
+                    self.rocket_text_timer = 60 # テキスト表示用
+                self.traffic.clear() # 初期化
+        else:
+            self.frame_count += 1
+            self.traffic.update_spawner(self.frame_count)
+
+        if self.is_respawning:
+            self.respawn_timer += 1
+            if self.respawn_timer > 30:
+                self.is_respawning = False
+                self.car_x = 0
+            return
+        #スピン
+        if self.is_spinning:
+            self.spin_timer += 1
+            self.car_x -= self.car_x * 0.1 # 徐々にセンターへ戻る
+
+            # self.u をタイマーに合わせてループさせることで回転を表現
+            spin_frames = [49, -50, 50, -50] # 標準, 左向き, 右向きなどの切り替え
+            self.u = spin_frames[(self.spin_timer // 2) % 4]
+            self.w = 26 # 旋回用の幅を使用
+
+            if self.spin_timer > 30: # 1秒弱で復帰
+                self.is_spinning = False
+                self.is_kanban = False
+                self.spin_timer = 0
+                self.events.append("spin_end")
+            if not self.is_kanban:
+                return # スピン中は操作不能
+
+        if not self.is_goal and self.start_timer == 0:
+            if self.is_stalled:
+                self.velocity = 0
+                self.events.append("stall")
+            else:
+                if pressed & INPUT_GEAR_UP: self.gear = min(self.gear + 1, 4)
+                if pressed & INPUT_GEAR_DOWN: self.gear = max(self.gear - 1, 0)
+                gear_set = self.gear_settings[self.gear]
+                self.is_braking = False
+                if inputs & INPUT_UP:
+                    if self.velocity < gear_set["max_vel"]:
+                        if not self.is_automatic:
+                            self.velocity += 0.002 * gear_set["accel"]
+                        else:
+                            self.velocity += 0.002 * gear_set["accel"] * 0.8
+                    else:
+                        self.velocity = max(self.velocity - 0.001, gear_set["max_vel"])
+                elif inputs & INPUT_DOWN:
+                    self.velocity = max(self.velocity - 0.004, 0)
+                    self.is_braking = True
+                else:
+                    self.velocity = max(self.velocity - 0.0005, 0)
+                if pressed & INPUT_NITRO and self.boost_cooldown == 0:
+                    self.is_boosting = True
+                    self.boost_timer = 30  # 1秒間加速
+                    self.boost_cooldown = 300 # 次に使えるまで10秒間のクールダウン
+
+                if self.is_boosting:
+                    self.velocity = min(self.velocity + 0.005, 0.8) # 通常の最高速(0.7)を超える0.8まで加速
+                    self.boost_timer -= 1
+                    self.events.append("boost")
+                    if self.boost_timer <= 0:
+                        self.is_boosting = False
+                        self.events.append("boost_end")
+
+                if self.boost_cooldown > 0:
+                    self.boost_cooldown -= 1
+        else:
+            self.is_braking = False
+            if self.start_timer == 0:
+                self.velocity = max(self.velocity - (self.velocity - 0.05)/100, 0.05)
+            if abs(self.car_x) > 0.1:
+                self.car_x -= self.car_x * 0.03
+            else:
+                self.car_x = 0
+
+        self.speed += self.velocity
+        self.kilometer = int(self.velocity * 400)
+
+        if not self.is_goal:
+            self.total_distance += self.velocity * 0.005
+            self.odometer = round(self.total_distance, 2)
+
+        self.track_pos += self.velocity * 5
+        self.segment = self.track.segment_at(self.track_pos)
+        self.target_curve = self.segment.curve
+        self.curve_val += (self.target_curve - self.curve_val) * 0.05
+
+        if not self.is_goal:
+            handling_factor = math.sin(max(0, min(self.velocity / 0.6 * math.pi, math.pi)))
+            move_amount = 7.5 * handling_factor
+            if not self.is_spinning:
+                if inputs & INPUT_LEFT:
+                    self.car_x -= move_amount
+                    self.u, self.w = -50, 26
+                elif inputs & INPUT_RIGHT:
+                    self.car_x += move_amount
+                    self.u, self.w = 50, 26
+                else:
+                    self.u, self.w = 49, 0
+            self.car_x -= self.curve_val * (self.velocity * 7)
+        else:
+            if self.target_curve < -0.5:     # 左カーブ
+                self.u, self.w = -50, 26
+            elif self.target_curve > 0.5:    # 右カーブ
+                self.u, self.w = 50, 26
+            else:                           # 直進
+                self.u, self.w = 49, 0
+        if abs(self.car_x) > self.ROAD_LIMIT and not self.is_goal:
+            self.is_out = True
+            self.grass_shake = self.fx_rng.uniform(-2, 2) * self.velocity * 10
+            if self.velocity > 0.15:
+                self.velocity = max(self.velocity - 0.005, 0)
+            if abs(self.car_x) > 400:
+                self.is_respawning = True
+                self.velocity = 0
+                self.respawn_timer = 0
+        else:
+            self.is_out = False
+
+        if self.odometer >= self.goal_distance and not self.is_goal:
+            self.is_goal = True
+            self.goal_time = self.frame_count / FPS
+            self.events.append("goal")
+
+    def update_rivals(self):
+        self.traffic.update(self.tick, self.velocity, self.events)
+
+    def update_timers(self):
+        # 表示用タイマー（以前は描画側で減らしていたもの）
+        if self.rocket_text_timer > 0:
+            self.rocket_text_timer -= 1
+            if self.rocket_text_timer == 0:
+                self.is_rocket_start = False
+        if self.stall_timer > 0:
+            self.stall_timer -= 1
+            if self.stall_timer == 0:
+                self.is_stalled = False
+
+    # --- 木・ライバルとの衝突判定とペナルティ（check_roadside_hits / check_rival_hits から毎ティック呼ぶ） ---
+    def object_screen_x(self, obj, p, car_x=None):
+        # 木・看板の画面上の x 座標（p は画面上の遠近係数。car_x は描画用に補間した値を渡せる）
+        if car_x is None:
+            car_x = self.car_x
+        curve_off = self.curve_val * (1 - p)**3 * 80
+        road_center_at_y = (SCREEN_W / 2) + curve_off - (car_x * p)
+        current_road_half_width = (10 + (p * 100) * 1.5)
+        side = 1 if obj.margin_x > 0 else -1
+        if obj.type == "sign":
+            # 縁石の幅(edge_w)を考慮して少し外側に配置
+            edge_w = 5 * p + 3
+            # 縁石の端 + わずかなマージン（遠近感を考慮）
+            offset_from_center = current_road_half_width + edge_w + (2 * p)
+            return road_center_at_y + (offset_from_center * side)
+        # 木は従来通り、ランダムなマージンを持たせる
+        return road_center_at_y + (current_road_half_width * side) + (obj.margin_x * p)
+
+    def check_roadside_hits(self):
+        # 自車の奥行き帯に入っているものだけを奥行き順の並びから二分探索で取り出して調べる
+        view_h = SCREEN_H - HORIZON
+        p_min, p_max = self.HIT_P_RANGE
+        near = self.speed + (1 - p_max) * view_h / 10 - 0.01
+        far = self.speed + (1 - p_min) * view_h / 10 + 0.01
+        for obj in self.roadside.between(near, far):
+            obj_y_screen = SCREEN_H - (obj.depth - self.speed) * 10
+            p = (obj_y_screen - HORIZON) / view_h
+            if p_min < p < p_max:
+                # 判定幅（車の中心からの距離）
+                hit_range = 15 if obj.type == "tree" else 12
+                if abs(self.object_screen_x(obj, p) - SCREEN_W / 2) < hit_range:
+                    self.hit_object(obj)
+
+    def hit_object(self, obj):
+        if self.is_spinning:
+            return
+        if obj.type == "tree":
+            # 【木】速度をゼロにしてスピン、操作不能にする
+            self.velocity = 0
+            self.shake_amount = 8  # 衝撃大
+            self.is_spinning = True
+            self.spin_timer = 0
+        else:
+            self.velocity = max(self.velocity - 0.075, 0.05)
+            self.is_spinning = True
+            self.is_kanban = True
+            self.shake_amount = 4
+
+    def check_rival_hits(self):
+        # 全車の画面上の位置をまとめて計算し、当たった車のうち一番奥のものだけを処理する
+        i = self.traffic.find_hit(self.curve_val, self.car_x, SCREEN_W)
+        if i >= 0:
+            self.hit_rival(i)
+
+    def hit_rival(self, i):
+        if self.traffic.blown_timer[i] > 0 or self.is_spinning:
+            return
+        self.velocity *= 0.5
+        self.is_spinning = True
+        self.is_kanban = True
+        self.spin_timer = 0
+        self.shake_amount = 10
+        self.traffic.blow(i)
@@ -0,0 +1,41 @@
+import random
+from collections import deque
+
+SEGMENT_LENGTH = 150  # track_pos でのセグメントの長さ（走行距離 1km = track_pos 1000）
+
+
+class Segment:
+    __slots__ = ("curve",)
+
+    def __init__(self, curve):
+        self.curve = curve  # カーブの強さ（-1.5〜1.5、マイナスが左）
+
+
+class TrackStream:
+    """seed から決まるコースを、track_pos が進むのに合わせてセグメント単位で作る。
+    持っているのは今いるセグメントから window 個先までだけなので、
+    どれだけ長いレースでもメモリは増えず、コースが途中で繰り返すこともない。
+    カーブは "{seed}:track" の乱数列から順に引くので、最初の 50 セグメントは
+    以前の50個ループのコースと同じになる"""
+    def __init__(self, seed, window=4):
+        self.rng = random.Random(f"{seed}:track")
+        self.base = 0  # segments[0] のセグメント番号
+        self.segments = deque(self.generate() for _ in range(window))
+
+    def generate(self):
+        return Segment(self.rng.uniform(-1.5, 1.5))
+
+    def segment_at(self, track_pos):
+        index = int(track_pos / SEGMENT_LENGTH)
+        # track_pos は戻らないので、通り過ぎたセグメントは捨てて先を1つ作る
+        while self.base < index:
+            self.segments.popleft()
+            self.segments.append(self.generate())
+            self.base += 1
+        return self.segments[max(index - self.base, 0)]
+
+
+def track_curves(seed, count):
+    # TrackStream と同じコースの先頭 count セグメント分のカーブ（BatchSimulation に渡す用）
+    rng = random.Random(f"{seed}:track")
+    return [rng.uniform(-1.5, 1.5) for _ in range(count)]
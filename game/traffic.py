@@ -0,0 +1,241 @@
+import random
+import numpy as np
+
+# 色のバリエーション (2:茶, 14:ピンク, 15:肌色, 12:青, 10:黄, 3:緑)
+RIVAL_COLORS = [2, 14, 15, 12, 10, 3, 9, 11]
+SPAWN_DEPTH = 800          # 遠く（地平線）にスポーン
+DESPAWN_DEPTH = (-200, 900)  # 後ろに消えた・遠ざかりすぎた車を消す範囲
+VIEW_DEPTH = 500.0         # これより奥は描画しない
+ROAD_HALF_WIDTH = 90       # 車を置く範囲（道路中央からの距離）
+FREE_LANES = 4             # 車線なしのときも、周りの車を調べるときはこの数の帯に分ける
+FOLLOW_GAP = 120           # 同じ車線の前の車とこれより近づいたら追い越すか後ろにつく
+LANE_CHECK = (60, 120)     # 車線変更先に車がいないか調べる範囲（後ろ, 前）
+STEER_SPEED = 3.0          # 横方向に動く速さ（1フレームあたり）
+LANE_MARGIN = 8            # ふらついても車線の端からこれ以上は寄らない（隣の車線の車と重ならないように）
+
+
+class TrafficPool:
+    """ライバル車（NPC）を固定容量の配列で持つ。先頭 count 台が走っている車で、
+    消えた車は順番を保ったまま前に詰める。
+    limit: 同時に走る台数の上限, interval: スポーンの間隔（フレーム）,
+    lanes: 車線の数（0 なら道路上のどこにでも置く）
+
+    前の車に追いついたら、隣の車線が空いていれば車線を変えて追い越し、
+    空いていなければ前の車の速さに合わせて後ろにつく。
+    周りの車は毎フレーム (車線, 奥行き) で並べた配列を二分探索して調べるので O(n log n)"""
+    def __init__(self, limit=3, interval=90, lanes=0, rng=None):
+        self.rng = rng or random.Random()
+        self.limit = limit
+        self.interval = interval
+        self.lanes = lanes
+        self.lane_count = lanes or FREE_LANES
+        self.lane_w = ROAD_HALF_WIDTH * 2 / self.lane_count
+        self.lane_margin = min(LANE_MARGIN, self.lane_w / 4)
+        self.count = 0
+        self.spawn_timer = 0
+        self.spawned = 0  # スポーンした延べ台数
+        # 決められたフレームに決められた車を出す表（コースファイル用）。None なら interval ごとにランダム
+        self.schedule = None
+        self.next_spawn = 0
+        self.depth = np.zeros(limit)
+        self.prev_depth = np.zeros(limit)  # 1ステップ前の depth（描画の補間用）
+        self.offset_x = np.zeros(limit)
+        self.target_x = np.zeros(limit)   # 向かっている横位置（車線変更先）
+        self.lane = np.zeros(limit, dtype=np.int64)
+        self.speed_kmh = np.zeros(limit)
+        self.cruise_kmh = np.zeros(limit)  # 前が空いているときに出したい速さ
+        self.col = np.zeros(limit, dtype=np.int64)
+        self.blown_timer = np.zeros(limit, dtype=np.int64)  # 0 より大きい間は吹き飛び中
+        self.fields = (self.depth, self.prev_depth, self.offset_x, self.target_x, self.lane, self.speed_kmh,
+                       self.cruise_kmh, self.col, self.blown_timer)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+        self.next_spawn = 0
+
+    def lane_x(self, lane):
+        # 車線の中心（道路の幅を lane_count 等分）
+        return -ROAD_HALF_WIDTH + self.lane_w * (lane + 0.5)
+
+    def lane_of(self, offset_x):
+        return min(max(int((offset_x + ROAD_HALF_WIDTH) // self.lane_w), 0), self.lane_count - 1)
+
+    def spawn(self, depth):
+        if self.count == self.limit:
+            return -1
+        rng = self.rng
+        if self.lanes:
+            offset_x = self.lane_x(rng.randrange(self.lanes))
+        else:
+            offset_x = rng.uniform(-ROAD_HALF_WIDTH, ROAD_HALF_WIDTH)
+        # 同じ車線のすぐ近くに車がいたら、空いている隣の車線にずらす（どこも空いていなければ出さない）
+        n = self.count
+        lane = self.lane_of(offset_x)
+        nearby = self.lane[:n][np.abs(self.depth[:n] - depth) < FOLLOW_GAP]
+        for k in range(self.lane_count):
+            free_lane = (lane + k) % self.lane_count
+            if not (nearby == free_lane).any():
+                offset_x += (free_lane - lane) * self.lane_w
+                break
+        else:
+            return -1
+        speed_kmh = rng.uniform(140, 210)  # 速度差を少し縮めて団子状態を防ぐ
+        return self.add(depth, offset_x, speed_kmh, rng.choice(RIVAL_COLORS))
+
+    def add(self, depth, offset_x, speed_kmh, col):
+        if self.count == self.limit:
+            return -1
+        i = self.count
+        self.count += 1
+        self.spawned += 1
+        self.depth[i] = self.prev_depth[i] = depth
+        self.set_car(i, offset_x, speed_kmh)
+        self.col[i] = col
+        self.blown_timer[i] = 0
+        return i
+
+    def set_car(self, i, offset_x, speed_kmh):
+        # 横位置と速さを置き直す（車線もそれに合わせる）
+        self.offset_x[i] = self.target_x[i] = offset_x
+        self.lane[i] = self.lane_of(offset_x)
+        self.speed_kmh[i] = self.cruise_kmh[i] = speed_kmh
+
+    def update_spawner(self, frame):
+        if self.schedule is not None:
+            # 表の frame（スタートからのフレーム数）になった車を出す
+            schedule = self.schedule
+            while self.next_spawn < len(schedule) and schedule["frame"][self.next_spawn] <= frame:
+                car = schedule[self.next_spawn]
+                self.add(float(car["depth"]), float(car["offset_x"]), float(car["speed_kmh"]), int(car["col"]))
+                self.next_spawn += 1
+            return
+        # 上限に空きがあれば interval フレームごとに1台ずつ出す
+        if self.count < self.limit:
+            if self.spawn_timer > 0:
+                self.spawn_timer -= 1
+            else:
+                self.spawn(SPAWN_DEPTH)
+                self.spawn_timer = self.interval
+
+    def update(self, tick, velocity, events):
+        n = self.count
+        if n == 0:
+            return
+        depth, offset_x, target_x = self.depth[:n], self.offset_x[:n], self.target_x[:n]
+        self.prev_depth[:n] = depth
+        speed_kmh, cruise_kmh, blown_timer = self.speed_kmh[:n], self.cruise_kmh[:n], self.blown_timer[:n]
+        target_x += np.sin(tick * 0.05 + depth) * 0.5
+
+        # 1. 吹き飛び中の車は奥へ飛ばされる
+        blown = blown_timer > 0
+        blown_count = int(np.count_nonzero(blown))
+        if blown_count:
+            events.extend(["crash"] * blown_count)
+            blown_timer[blown] -= 1
+            depth[blown] += 2.0
+            for i in np.flatnonzero(blown & (blown_timer <= 0)):
+                speed_kmh[i] = cruise_kmh[i] = self.rng.uniform(120, 180)
+
+        # 2. 前の車を見て、追い越す・後ろにつく・元の速さに戻す
+        moving = ~blown
+        self.drive(moving)
+        step = np.clip(target_x - offset_x, -STEER_SPEED, STEER_SPEED)
+        offset_x[moving] += step[moving]
+
+        # 3. 自律走行。描画上の位置(depth)は「ライバルの進んだ距離 - 自車の進んだ距離」
+        depth[moving] += (speed_kmh[moving] / 400 - velocity) * 100  # 秒速的な係数に変換
+
+        # 4. 後ろに消えた(追い越した)車、遠ざかりすぎて見えなくなった車を消す
+        near, far = DESPAWN_DEPTH
+        keep = blown | ((depth >= near) & (depth <= far))
+        alive = np.flatnonzero(keep)
+        if alive.size < n:
+            for field in self.fields:
+                field[:alive.size] = field[alive]
+            self.count = alive.size
+
+    def lanes_of(self, offset_x):
+        # lane_of を配列でまとめて
+        return np.clip(((offset_x + ROAD_HALF_WIDTH) // self.lane_w).astype(np.int64), 0, self.lane_count - 1)
+
+    def drive(self, moving):
+        n = self.count
+        depth, lane, speed_kmh = self.depth[:n], self.lane[:n], self.speed_kmh[:n]
+        target_x = self.target_x[:n]
+        # 車線は向かっている横位置から決め直し、ふらついても車線（車線なしのときは帯）の中に収める
+        lane[:] = self.lanes_of(target_x)
+        left = self.lane_x(lane) - self.lane_w / 2
+        np.clip(target_x, left + self.lane_margin, left + self.lane_w - self.lane_margin, out=target_x)
+        # (車線, 奥行き) の順に並べ、並びの隣が同じ車線なら「すぐ前の車」
+        order = np.lexsort((depth, lane))
+        sorted_lane = lane[order]
+        same = sorted_lane[1:] == sorted_lane[:-1]
+        ahead = np.full(n, -1)
+        ahead[order[:-1][same]] = order[1:][same]
+        has_ahead = ahead >= 0
+        gap = np.where(has_ahead, depth[ahead] - depth, np.inf)
+        close = moving & has_ahead & (gap < FOLLOW_GAP)
+        blocked = close & (speed_kmh[ahead] < self.cruise_kmh[:n])  # 前の車が遅い
+
+        # 車線ごとに奥行きが並ぶキー。隣の車線の前後に車がいるかを二分探索で数える
+        span = DESPAWN_DEPTH[1] - DESPAWN_DEPTH[0] + 10000
+        keys = sorted_lane * span + depth[order]
+        back, front = LANE_CHECK
+        changed = np.zeros(n, dtype=bool)
+        for side in (-1, 1):  # 左を優先して追い越す
+            new_lane = lane + side
+            want = blocked & ~changed & (new_lane >= 0) & (new_lane < self.lane_count)
+            if not want.any():
+                continue
+            lo = np.searchsorted(keys, new_lane * span + depth - back)
+            hi = np.searchsorted(keys, new_lane * span + depth + front)
+            free = np.flatnonzero(want & (lo == hi))
+            if free.size == 0:
+                continue
+            # 同じ車線へ同時に入ろうとする車どうしがぶつからないよう、前に別の候補がいる車は待たせる
+            key = new_lane[free] * span + depth[free]
+            wanted = np.sort(key)
+            ahead_count = np.searchsorted(wanted, key + front, side="right") - np.searchsorted(wanted, key) - 1
+            free = free[ahead_count == 0]
+            # target_x は車線の中に収めてあるので、lane_w ずらせばちょうど隣の車線に入る
+            target_x[free] += side * self.lane_w
+            lane[free] = new_lane[free]
+            changed[free] = True
+            # 反対側へ動く車は、いま車線を変えた車も避けるように並べ直す
+            order = np.lexsort((depth, lane))
+            keys = lane[order] * span + depth[order]
+
+        # 出したい速さに近づけるが、前の車に近いうちはその車より速くしない（すり抜け防止）
+        speed_kmh[moving] += (self.cruise_kmh[:n][moving] - speed_kmh[moving]) * 0.05
+        follow = close & ~changed
+        speed_kmh[follow] = np.minimum(speed_kmh[follow], speed_kmh[ahead[follow]])
+
+    def perspective(self, alpha=1.0):
+        # 見えている車の番号と遠近係数 p（奥から順）。
+        # alpha < 1 なら1ステップ前の位置との間（描画の補間用）
+        n = self.count
+        depth = self.depth[:n]
+        if alpha < 1.0:
+            prev = self.prev_depth[:n]
+            depth = prev + (depth - prev) * alpha
+        visible = np.flatnonzero((depth > 0) & (depth < VIEW_DEPTH))
+        visible = visible[np.argsort(-depth[visible], kind="stable")]
+        raw_p = 1.0 - depth[visible] / VIEW_DEPTH
+        return visible, raw_p ** 1.5 * 0.9 + 0.1
+
+    def find_hit(self, curve_val, car_x, screen_w):
+        # 自車の p 値付近にいて画面上で自車と重なる車のうち、一番奥のもの（なければ -1）
+        index, p = self.perspective()
+        c_off = curve_val * (1 - p) ** 3 * 80
+        riv_x = screen_w / 2 + c_off - car_x * p + self.offset_x[index] * p
+        hit = ((p > 0.70) & (p < 0.95) & (np.abs(riv_x - screen_w / 2) < 20)
+               & (self.blown_timer[index] == 0))
+        hits = np.flatnonzero(hit)
+        return int(index[hits[0]]) if hits.size else -1
+
+    def blow(self, i):
+        self.speed_kmh[i] = 270
+        self.blown_timer[i] = 10
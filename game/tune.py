@@ -0,0 +1,164 @@
+"""GEAR_SETTINGS（ギアごとの accel / max_vel）とオートマの変速点を振りながら、
+描画なしのレースを BatchSimulation でまとめて走らせ、ゴールタイムの分布を比べる。
+設定ごとのレースは multiprocessing で全コアに分ける。レースごとにコースとボットの運転
+（踏み出し・カーブでのアクセル・ハンドル・変速点・ニトロのタイミング）がばらつき、コースと乱数は設定によらず
+同じものを使うので、設定どうしの差がそのまま比べられる。
+
+    python tune.py                                          # 今の設定を AT / MT で
+    python tune.py --distances 1 3 5 10 --races 2000
+    python tune.py --accel 0.9 1 1.1 --max-vel 0.95 1 1.05  # 表全体の accel / max_vel を倍率で振る
+    python tune.py --shift-up 0.8 0.85 0.9 --shift-down 0.5 0.6
+    python tune.py --samples 64 --jitter 0.1                # ギアごとの値をランダムに ±10% ずらした表も試す
+    python tune.py --spread 0                               # ボットの運転のばらつきなし
+"""
+import argparse
+import itertools
+import multiprocessing
+import sys
+import time
+import numpy as np
+from batch_sim import BatchSimulation, gear_table
+from simulation import Simulation, INPUT_UP, INPUT_LEFT, INPUT_RIGHT, INPUT_GEAR_UP, INPUT_NITRO
+
+
+def bot_driver(batch, mt_shift_rpm, nitro, spread=1.0):
+    """アクセル全開でコース中央を保つボット。MT は回転数が変速点を超えたらシフトアップ。
+    人の運転のばらつきとして、踏み出すタイミング・アクセルを戻すカーブの強さ・ハンドルを切り始める位置・
+    MT の変速点・ニトロを使うまでの間をレースごとに batch.rng でずらす（spread = 0 なら全レース同じ運転）"""
+    rng, n = batch.rng, batch.n
+    # カウントダウンの残りがこのフレーム数になったら踏む（10〜40 の間で踏み続ければロケットスタート、
+    # 40 より前に踏むとエンスト。ばらつかせると、ときどき出遅れたりエンストしたりする）
+    launch = np.round(26 + rng.uniform(-16, 16, n) * spread)
+    # カーブの強さ（最大 1.5）がこれを超えている間は、速度 0.3 まではアクセルを戻す
+    lift_curve = 1.5 - rng.uniform(0, 0.3, n) * spread
+    steer_margin = 20 + rng.uniform(-10, 10, n) * spread
+    shift_rpm = np.minimum(mt_shift_rpm + rng.uniform(-0.05, 0.05, n) * spread, 0.99)
+    # ニトロが使えるようになってから、1フレームごとにこの確率で押す（平均で 1/確率 フレーム待つ）
+    nitro_chance = 1 / (1 + 30 * spread)
+
+    def driver(batch):
+        inputs = np.where(batch.start_timer <= launch, INPUT_UP, 0)
+        inputs[(batch.start_timer == 0) & (np.abs(batch.curve_val) > lift_curve) & (batch.velocity > 0.3)] = 0
+        inputs[batch.car_x > steer_margin] |= INPUT_LEFT
+        inputs[batch.car_x < -steer_margin] |= INPUT_RIGHT
+        # ボタンは押した瞬間だけ効くので、前のステップで押していたら一度離す
+        released = (batch.prev_inputs & INPUT_GEAR_UP) == 0
+        inputs[~batch.is_automatic & (batch.rpm > shift_rpm) & released] |= INPUT_GEAR_UP
+        if nitro:
+            ready = (batch.boost_cooldown == 0) & ((batch.prev_inputs & INPUT_NITRO) == 0)
+            inputs[ready & (batch.rng.random(batch.n) < nitro_chance)] |= INPUT_NITRO
+        return inputs
+    return driver
+
+
+def run_job(job):
+    """1つの設定・距離・AT/MT で races 本走らせてゴールタイムの配列を返す（ワーカープロセスで呼ばれる）"""
+    key, table, shift_points, is_automatic, distance, races, seed, mt_shift_rpm, nitro, spread = job
+    batch = BatchSimulation(races, distance, is_automatic, table, seed=seed, shift_points=shift_points)
+    # 一番遅いギアの惰性（0.05）でもゴールできる長さ
+    max_ticks = int(distance / (0.05 * 0.005)) + 300
+    return key, batch.run(bot_driver(batch, mt_shift_rpm, nitro, spread), max_ticks)
+
+
+def make_tables(base, accel_scales, max_vel_scales, samples, jitter, rng):
+    # (名前, (G, 2) の表) のリスト。先頭は今の設定
+    tables = []
+    for a, m in itertools.product(accel_scales, max_vel_scales):
+        name = "base" if (a, m) == (1.0, 1.0) else f"accel x{a:g} max_vel x{m:g}"
+        tables.append((name, base * [a, m]))
+    tables.sort(key=lambda t: t[0] != "base")
+    for k in range(samples):
+        table = base * rng.uniform(1 - jitter, 1 + jitter, base.shape)
+        table[:, 1].sort()  # 上のギアほど最高速が高い並びは保つ
+        tables.append((f"random #{k}", table))
+    return tables
+
+
+def summarize(times):
+    finished = times[~np.isnan(times)]
+    if finished.size == 0:
+        return {"finished": 0.0}
+    p10, p50, p90 = np.percentile(finished, [10, 50, 90])
+    return {"finished": finished.size / times.size, "mean": finished.mean(), "std": finished.std(),
+            "p10": p10, "p50": p50, "p90": p90, "best": finished.min()}
+
+
+def format_table(table):
+    return " ".join(f"{accel:.3f}/{max_vel:.3f}" for accel, max_vel in table)
+
+
+def report(results, tables, top):
+    for distance, mode in sorted({(k[0], k[1]) for k in results}):
+        rows = [(key, summarize(times)) for key, times in results.items() if key[:2] == (distance, mode)]
+        rows.sort(key=lambda r: (-r[1]["finished"], r[1].get("p50", 0)))
+        # 今の設定（表も変速点もそのまま）との p50 の差
+        base = next((s for key, s in rows
+                     if tables[key[2]][0] == "base" and key[3] == Simulation.SHIFT_POINTS), None)
+        print(f"\n{distance}km {mode}")
+        print(f"  {'config':34}{'shift':>10}{'done':>6}{'mean':>8}{'std':>7}"
+              f"{'p10':>8}{'p50':>8}{'p90':>8}{'best':>8}{'vs base':>9}")
+        for (_, _, index, shift), s in rows[:top]:
+            shift_text = f"{shift[0]:g}/{shift[1]:g}" if mode == "AT" else "-"
+            if not s["finished"]:
+                print(f"  {tables[index][0]:34}{shift_text:>10}{0:6.0%}")
+                continue
+            diff = f"{s['p50'] - base['p50']:+8.2f}s" if base and base["finished"] else ""
+            print(f"  {tables[index][0]:34}{shift_text:>10}{s['finished']:6.0%}{s['mean']:8.2f}{s['std']:7.2f}"
+                  f"{s['p10']:8.2f}{s['p50']:8.2f}{s['p90']:8.2f}{s['best']:8.2f}{diff:>9}")
+    print("\nconfigs (accel/max_vel per gear):")
+    for name, table in tables:
+        print(f"  {name:34}{format_table(table)}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Monte Carlo sweep of gear tables and automatic shift points.")
+    parser.add_argument("--distances", type=float, nargs="+", default=[1.0, 3.0, 5.0], help="goal distances (km)")
+    parser.add_argument("--races", type=int, default=500, help="races per config and distance")
+    parser.add_argument("--accel", type=float, nargs="+", default=[1.0], help="scales for every gear's accel")
+    parser.add_argument("--max-vel", type=float, nargs="+", default=[1.0], help="scales for every gear's max_vel")
+    parser.add_argument("--samples", type=int, default=0, help="random gear tables to add")
+    parser.add_argument("--jitter", type=float, default=0.1, help="relative spread of the random tables")
+    parser.add_argument("--shift-up", type=float, nargs="+", default=[Simulation.SHIFT_POINTS[0]],
+                        help="automatic upshift rpm")
+    parser.add_argument("--shift-down", type=float, nargs="+", default=[Simulation.SHIFT_POINTS[1]],
+                        help="automatic downshift rpm")
+    parser.add_argument("--mt-shift", type=float, default=0.9, help="rpm at which the MT bot shifts up")
+    parser.add_argument("--modes", nargs="+", choices=["AT", "MT"], default=["AT", "MT"])
+    parser.add_argument("--nitro", action="store_true", help="let the bot use nitro when it is ready")
+    parser.add_argument("--spread", type=float, default=1.0,
+                        help="scale of the per-race driver variation (0: every race driven the same)")
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--top", type=int, default=10, help="rows to show per distance and mode")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    base = gear_table(Simulation.GEAR_SETTINGS)
+    tables = make_tables(base, args.accel, args.max_vel, args.samples, args.jitter, rng)
+    shifts = [(up, down) for up, down in itertools.product(args.shift_up, args.shift_down) if down < up]
+    # 結果のキー: (距離, "AT"/"MT", 表の番号, 変速点)。MT は変速点を使わないので1回だけ
+    jobs = []
+    for index, (_, table) in enumerate(tables):
+        for d, distance in enumerate(args.distances):
+            seed = args.seed + d  # 同じ距離ならどの設定も同じコース・同じ乱数で走る
+            if "AT" in args.modes:
+                for shift in shifts:
+                    jobs.append(((distance, "AT", index, shift), table, shift, True, distance,
+                                 args.races, seed, args.mt_shift, args.nitro, args.spread))
+            if "MT" in args.modes:
+                jobs.append(((distance, "MT", index, Simulation.SHIFT_POINTS), table, None, False, distance,
+                             args.races, seed, args.mt_shift, args.nitro, args.spread))
+
+    start = time.perf_counter()
+    results = {}
+    with multiprocessing.Pool(args.workers) as pool:
+        for key, times in pool.imap_unordered(run_job, jobs):
+            results[key] = times
+    elapsed = time.perf_counter() - start
+    print(f"{len(jobs) * args.races} races ({len(jobs)} jobs) in {elapsed:.1f}s")
+    report(results, tables, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))